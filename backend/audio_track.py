@@ -0,0 +1,133 @@
+"""
+Audio Track
+
+Memory-mapped access to a PCM WAV file, so that the audio track of a video is
+decoded once (by ffmpeg, into `{VIDEO_ID}_original.wav`) and every sentence's
+audio clip is a zero-copy slice of it, instead of one ffmpeg process per clip.
+
+Supported formats: integer PCM (8, 16, 24 and 32 bit; 24 bit frames are kept as
+raw bytes) and 32/64 bit float, including WAVE_FORMAT_EXTENSIBLE headers.
+
+Usage:
+    track = AudioTrack("video_original.wav")
+    samples = track.slice(12.5, 22.5)      # numpy view, shape (frames, channels)
+    track.write_clip("clip.wav", 12.5, 22.5)
+    wav_bytes = track.clip_bytes(12.5, 22.5)
+"""
+
+import io
+import os
+import struct
+
+import numpy as np
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioTrack:
+    def __init__(self, wav_path):
+        self.path = wav_path
+        with open(wav_path, "rb") as f:
+            riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave_id != b"WAVE":
+                raise ValueError(f"{wav_path} is not a WAV file")
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{wav_path} has no data chunk")
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    fmt = f.read(chunk_size)
+                    if chunk_size % 2:
+                        f.read(1)
+                elif chunk_id == b"data":
+                    data_offset = f.tell()
+                    data_size = chunk_size
+                    break
+                else:
+                    # chunks are word aligned
+                    f.seek(chunk_size + chunk_size % 2, 1)
+        if fmt is None:
+            raise ValueError(f"{wav_path} has no fmt chunk")
+
+        (
+            self.format_tag,
+            self.channels,
+            self.sample_rate,
+            _,
+            self.block_align,
+            self.bits_per_sample,
+        ) = struct.unpack("<HHIIHH", fmt[:16])
+        if self.format_tag == WAVE_FORMAT_EXTENSIBLE:
+            # the actual format is the first two bytes of the sub-format GUID
+            self.format_tag = struct.unpack("<H", fmt[24:26])[0]
+        self._fmt = fmt
+
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype = {32: "<f4", 64: "<f8"}[self.bits_per_sample]
+        elif self.format_tag == WAVE_FORMAT_PCM:
+            dtype = {8: "u1", 16: "<i2", 32: "<i4"}.get(self.bits_per_sample, "u1")
+        else:
+            raise ValueError(f"unsupported WAV format {self.format_tag:#x}")
+        # ffmpeg writes a placeholder size when it cannot seek back, clamp to the file
+        file_size = os.path.getsize(wav_path)
+        data_size = min(data_size, file_size - data_offset)
+        self.num_frames = data_size // self.block_align
+        # 24 bit samples are kept as raw bytes, `slice` still returns whole frames
+        samples_per_frame = self.block_align // np.dtype(dtype).itemsize
+        self._samples = np.memmap(
+            wav_path,
+            dtype=dtype,
+            mode="r",
+            offset=data_offset,
+            shape=(self.num_frames, samples_per_frame),
+        )
+
+    @property
+    def duration(self):
+        return self.num_frames / self.sample_rate
+
+    def _frame_range(self, start_seconds, end_seconds):
+        start = min(max(0, int(round(start_seconds * self.sample_rate))), self.num_frames)
+        end = min(max(start, int(round(end_seconds * self.sample_rate))), self.num_frames)
+        return start, end
+
+    # samples between the two timestamps (clamped to the track), without copying
+    def slice(self, start_seconds, end_seconds):
+        start, end = self._frame_range(start_seconds, end_seconds)
+        return self._samples[start:end]
+
+    # frames [start_frame, end_frame) of the track, without copying
+    def frames(self, start_frame, end_frame):
+        return self._samples[start_frame:end_frame]
+
+    # the clip between the two timestamps as a complete WAV file in memory
+    def clip_bytes(self, start_seconds, end_seconds):
+        buffer = io.BytesIO()
+        self._write(buffer, self.slice(start_seconds, end_seconds))
+        return buffer.getvalue()
+
+    def write_clip(self, clip_path, start_seconds, end_seconds):
+        with open(clip_path, "wb") as f:
+            self._write(f, self.slice(start_seconds, end_seconds))
+        return clip_path
+
+    def _write(self, f, samples):
+        data_size = samples.shape[0] * self.block_align
+        fmt = self._fmt
+        riff_size = 4 + 8 + len(fmt) + len(fmt) % 2 + 8 + data_size + data_size % 2
+        f.write(struct.pack("<4sI4s", b"RIFF", riff_size, b"WAVE"))
+        f.write(struct.pack("<4sI", b"fmt ", len(fmt)))
+        f.write(fmt)
+        if len(fmt) % 2:
+            f.write(b"\0")
+        f.write(struct.pack("<4sI", b"data", data_size))
+        if data_size:
+            f.write(memoryview(np.ascontiguousarray(samples)).cast("B"))
+        if data_size % 2:
+            f.write(b"\0")
+
@@ -0,0 +1,266 @@
+"""
+Batch Video Parser
+
+Runs the video_parser.VideoPipeline over many videos. Each video is parsed in its own worker
+process (so videos do not share the parser's per-video state), and one failing
+video is recorded as failed without stopping the others, also when its worker
+process dies (killed, out of memory, crash in a native library) or exceeds
+--timeout.
+
+The two kinds of work are sized separately:
+- CPU-bound scene detection: one video at a time across the batch, split over
+  --cpu_workers processes (see scene_detection.py); the turn is handed out by
+  the batch process, which takes it back from a worker that exits
+- I/O-bound model calls: --io_workers sentences in flight per video, with up to
+  --parallel_videos videos in progress, so the model calls of some videos
+  overlap with the scene detection of another
+
+A status summary (state, error, duration, scene and sentence counts per video)
+is rewritten after every finished video.
+
+Usage:
+    python batch_parser.py [--videos_dir=<dir>] [--manifest=<file>] [--parallel_videos=<n>]
+                           [--cpu_workers=<n>] [--io_workers=<n>] [--fresh] [--sound]
+                           [--status_output=<file>] [--timeout=<seconds>]
+
+The manifest lists one video ID per line (lines starting with # are ignored) or
+is a JSON list of IDs. Without a manifest, every sub-directory of --videos_dir
+that contains {VIDEO_ID}.mp4 is parsed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+
+
+# read the video IDs from a manifest file, or list the videos in `videos_dir`
+def list_video_ids(videos_dir, manifest=None):
+    if manifest:
+        with open(manifest, "r") as f:
+            content = f.read()
+        if content.lstrip().startswith("["):
+            return json.loads(content)
+        return [
+            line.strip()
+            for line in content.splitlines()
+            if line.strip() and not line.strip().startswith("#")
+        ]
+    return sorted(
+        video_id
+        for video_id in os.listdir(videos_dir)
+        if os.path.isfile(os.path.join(videos_dir, video_id, f"{video_id}.mp4"))
+    )
+
+
+# Scene detection turn of a worker process. The turn is owned by the parent
+# (run_batch), which hands it to one video at a time and takes it back when that
+# video's process exits, so a worker that dies during scene detection does not
+# block the others.
+class _SceneDetectionTurn:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.send(("acquire", None))
+        self.connection.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.send(("release", None))
+        return False
+
+
+def _parse_video(video_id, videos_dir, io_workers, fresh, describe_sound, cpu_workers, connection):
+    from video_parser import VideoPipeline
+
+    start = time.time()
+    try:
+        summary = VideoPipeline(
+            video_id,
+            videos_dir=videos_dir,
+            max_workers=io_workers,
+            fresh=fresh,
+            describe_sound=describe_sound,
+            scene_workers=cpu_workers,
+            scene_detection_lock=_SceneDetectionTurn(connection),
+        ).run()
+        status = {"status": "done", **summary}
+    except Exception as e:
+        status = {
+            "video_id": video_id,
+            "status": "failed",
+            "error": repr(e),
+            "traceback": traceback.format_exc(),
+        }
+    status["seconds"] = round(time.time() - start, 1)
+    connection.send(("status", status))
+    connection.close()
+
+
+def write_status(status_output, statuses):
+    tmp_path = f"{status_output}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(statuses, f, indent=4)
+    os.replace(tmp_path, status_output)
+
+
+# A video being parsed in its own process
+class _Worker:
+    def __init__(self, video_id, args):
+        self.video_id = video_id
+        self.connection, child_connection = multiprocessing.Pipe()
+        # not a daemon: scene detection starts processes of its own
+        self.process = multiprocessing.Process(
+            target=_parse_video, args=(video_id, *args, child_connection)
+        )
+        self.process.start()
+        child_connection.close()
+        self.start = time.time()
+        self.status = None
+
+    # handle the messages sent so far; returns the scene detection requests and releases
+    def receive(self):
+        requests = []
+        try:
+            while self.connection.poll():
+                kind, payload = self.connection.recv()
+                if kind == "status":
+                    self.status = payload
+                else:
+                    requests.append(kind)
+        except (EOFError, OSError):
+            # the process exited, everything it sent has been read
+            pass
+        return requests
+
+    def finish(self, error=None):
+        self.process.join()
+        self.connection.close()
+        if self.status is None:
+            # the worker process itself died (e.g. killed, out of memory) or timed out
+            self.status = {
+                "video_id": self.video_id,
+                "status": "failed",
+                "error": error or f"worker process exited with code {self.process.exitcode}",
+                "seconds": round(time.time() - self.start, 1),
+            }
+        return self.status
+
+
+# Parse all videos, returns {video_id: status}. Every video runs in a process of its
+# own, so a crashing worker only fails its own video; a video still running after
+# `timeout` seconds is stopped and recorded as failed.
+def run_batch(
+    video_ids,
+    videos_dir,
+    parallel_videos=2,
+    cpu_workers=None,
+    io_workers=4,
+    fresh=False,
+    describe_sound=False,
+    status_output=None,
+    timeout=None,
+):
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    statuses = {video_id: {"video_id": video_id, "status": "pending"} for video_id in video_ids}
+    if status_output:
+        write_status(status_output, statuses)
+
+    args = (videos_dir, io_workers, fresh, describe_sound, cpu_workers)
+    pending = deque(video_ids)
+    running = []
+    # the video holding the scene detection turn, and the ones waiting for it
+    scene_detection_owner = None
+    scene_detection_waiting = deque()
+    while pending or running:
+        while pending and len(running) < max(1, parallel_videos):
+            running.append(_Worker(pending.popleft(), args))
+        wait_seconds = None
+        if timeout is not None:
+            wait_seconds = max(0, min(worker.start + timeout for worker in running) - time.time())
+        wait(
+            [worker.connection for worker in running]
+            + [worker.process.sentinel for worker in running],
+            timeout=wait_seconds,
+        )
+        for worker in list(running):
+            for request in worker.receive():
+                if request == "acquire":
+                    scene_detection_waiting.append(worker)
+                elif scene_detection_owner is worker:
+                    scene_detection_owner = None
+            error = None
+            timed_out = timeout is not None and time.time() - worker.start > timeout
+            if worker.process.is_alive() and timed_out:
+                worker.process.kill()
+                error = f"timed out after {timeout} seconds"
+            elif worker.process.is_alive():
+                continue
+            running.remove(worker)
+            statuses[worker.video_id] = worker.finish(error)
+            if scene_detection_owner is worker:
+                scene_detection_owner = None
+            if worker in scene_detection_waiting:
+                scene_detection_waiting.remove(worker)
+            print(f"[{statuses[worker.video_id]['status']}] {worker.video_id}")
+            if status_output:
+                write_status(status_output, statuses)
+        if scene_detection_owner is None and scene_detection_waiting:
+            scene_detection_owner = scene_detection_waiting.popleft()
+            try:
+                scene_detection_owner.connection.send(("granted", None))
+            except OSError:
+                # the process just exited, the turn is taken back when it is collected
+                pass
+    return statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--videos_dir",
+        type=str,
+        default=os.path.join(os.path.dirname(__file__), "data", "videos_study"),
+    )
+    parser.add_argument("--manifest", type=str, default=None)
+    parser.add_argument(
+        "--parallel_videos", type=int, default=2, help="videos in progress at the same time"
+    )
+    parser.add_argument(
+        "--cpu_workers", type=int, default=None, help="processes for scene detection (default: all CPUs)"
+    )
+    parser.add_argument(
+        "--io_workers", type=int, default=4, help="sentences in flight per video (model calls)"
+    )
+    parser.add_argument("--fresh", action="store_true")
+    parser.add_argument("--sound", action="store_true", help="describe the environment sound")
+    parser.add_argument("--status_output", type=str, default=None)
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="seconds after which a video is stopped and failed"
+    )
+    args = parser.parse_args()
+
+    video_ids = list_video_ids(args.videos_dir, args.manifest)
+    status_output = args.status_output or os.path.join(args.videos_dir, "batch_status.json")
+    print(f"--> Parsing {len(video_ids)} videos...")
+    statuses = run_batch(
+        video_ids,
+        args.videos_dir,
+        parallel_videos=args.parallel_videos,
+        cpu_workers=args.cpu_workers,
+        io_workers=args.io_workers,
+        fresh=args.fresh,
+        describe_sound=args.sound,
+        status_output=status_output,
+        timeout=args.timeout,
+    )
+    failed = [video_id for video_id, status in statuses.items() if status["status"] != "done"]
+    print(f"Done: {len(video_ids) - len(failed)} succeeded, {len(failed)} failed.")
+    print(f"Status written to {status_output}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,454 @@
+"""
+Offline Benchmark Suite
+
+Measures the parser without real videos, secret.json or live model endpoints.
+For every requested video length it generates a synthetic cooking-like video
+(coloured scenes with moving "hands" and texture, cut at a controlled rate)
+with a matching word-level SRT, procedure annotations and an audio track
+(speech-like narration, sizzling noise bursts, pauses), then reports:
+- scene detection: decoded frames per second, scenes found vs. cuts made
+- frame lookup: key frame index queries per second
+- audio slicing: 10 second WAV clips per second
+- SRT parsing: cues per second (words + sentence grouping)
+- end to end: sentences per second through VideoPipeline.run(), with GPT served
+  by the local stub server (stub_model_server.py) and GAMA by a local stub, both
+  answering deterministically after a configurable latency
+Every run is appended to a JSON Lines results file together with its settings
+and git revision, and compared with the previous run that used the same
+settings.
+
+The audio track is muxed into the video when ffmpeg is installed; otherwise the
+pipeline reads the synthetic WAV directly (the ffmpeg stage is then skipped).
+
+Usage:
+    python benchmark_suite.py [--lengths 30 120 300] [--cut_every=<s>] [--gpt_latency=<s>]
+                              [--gama_latency=<s>] [--max_workers=<n>] [--results=<file>]
+                              [--vision_mode=separate|fused|batched]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import wave
+
+import cv2
+import numpy as np
+
+import srt_parser
+import video_parser
+from audio_track import AudioTrack
+from frame_index import KeyFrameIndex
+from scene_detection import detect_key_frames
+from stub_model_server import start_stub_server
+
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "data", "benchmarks", "results.jsonl")
+FPS = 30
+FRAME_SIZE = (640, 360)
+SAMPLE_RATE = 16000
+WORDS = (
+    "now", "add", "the", "chopped", "onions", "to", "pan", "and", "stir", "them",
+    "for", "about", "two", "minutes", "until", "golden", "then", "season", "with", "salt",
+)
+
+
+######## Synthetic data ########
+# cut times (seconds) with scene lengths uniform in [0.5, 1.5] x cut_every
+def _cut_times(seconds, cut_every, rng):
+    cuts = []
+    t = cut_every * rng.uniform(0.5, 1.5)
+    while t < seconds:
+        cuts.append(t)
+        t += cut_every * rng.uniform(0.5, 1.5)
+    return cuts
+
+
+def _write_video(path, seconds, cut_every, rng):
+    width, height = FRAME_SIZE
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, FRAME_SIZE)
+    cuts = _cut_times(seconds, cut_every, rng)
+    texture = np.random.default_rng(rng.randrange(1 << 30)).integers(
+        0, 40, (height, width, 3), dtype=np.uint8
+    )
+    scene_starts = [0.0] + cuts
+    scene = -1
+    for frame_num in range(int(seconds * FPS)):
+        t = frame_num / FPS
+        if scene + 1 < len(scene_starts) and t >= scene_starts[scene + 1]:
+            scene += 1
+            # a new "shot": background (counter, board, pan) and object colours
+            background = np.array([rng.randrange(256) for _ in range(3)], np.uint8)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            frame = np.empty((height, width, 3), np.uint8)
+            frame[:] = background
+            frame = cv2.add(frame, texture)
+            phase = rng.uniform(0, 2 * np.pi)
+        image = frame.copy()
+        x = int(width / 2 + width / 4 * np.sin(phase + t * 2))
+        y = int(height / 2 + height / 6 * np.cos(phase + t * 3))
+        cv2.circle(image, (x, y), 40, color, -1)
+        cv2.rectangle(image, (x - 90, y + 30), (x - 30, y + 60), color, -1)
+        writer.write(image)
+    writer.release()
+    return len(cuts)
+
+
+# Word-level SRT (one word per cue) and procedure annotations every ~30 s;
+# returns the (start, end) seconds of the words for the audio track
+def _write_transcript(srt_path, procedure_path, seconds, rng):
+    def timestamp(ms):
+        return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+    words = []
+    t = 0.5
+    sentence_length = rng.randint(6, 14)
+    with open(srt_path, "w") as f:
+        while t + 0.3 < seconds:
+            sentence_length -= 1
+            text = rng.choice(WORDS) + ("." if sentence_length == 0 else "")
+            start, end = int(t * 1000), int((t + 0.3) * 1000)
+            f.write(f"{len(words) + 1}\n{timestamp(start)} --> {timestamp(end)}\n{text}\n\n")
+            words.append((t, t + 0.3))
+            t += 0.35
+            if sentence_length == 0:
+                sentence_length = rng.randint(6, 14)
+                # pause between sentences, now and then a long one
+                t += rng.choice((0.4, 0.6, 0.8, 3.0))
+
+    annotations = []
+    start = 0.0
+    while start < seconds:
+        end = min(seconds, start + rng.uniform(20, 40))
+        annotations.append({"segment": [start, end], "sentence": f"Step {len(annotations) + 1}."})
+        start = end
+    with open(procedure_path, "w") as f:
+        json.dump({"annotations": annotations}, f, indent=4)
+    return words
+
+
+# narration (harmonic tones during the words), sizzling bursts and a low noise floor
+def _write_audio(wav_path, seconds, words, rng):
+    noise = np.random.default_rng(rng.randrange(1 << 30))
+    audio = noise.normal(0, 0.001, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    for start, end in words:
+        first, last = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        t = np.arange(last - first) / SAMPLE_RATE
+        pitch = rng.uniform(110, 180)
+        voice = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 12))
+        audio[first:last] += (0.15 * voice * np.hanning(last - first)).astype(np.float32)
+    t = rng.uniform(0, 20)
+    while t < seconds:
+        length = rng.uniform(5, 15)
+        first, last = int(t * SAMPLE_RATE), int(min(seconds, t + length) * SAMPLE_RATE)
+        audio[first:last] += noise.normal(0, 0.08, last - first).astype(np.float32)
+        t += length + rng.uniform(20, 60)
+    with wave.open(wav_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+# Generate VIDEOS_DIR-style files for one synthetic video; returns the number of cuts
+def make_synthetic_video(videos_dir, video_id, seconds, cut_every=4.0, seed=0):
+    rng = random.Random(seed)
+    data_dir = os.path.join(videos_dir, video_id)
+    os.makedirs(data_dir, exist_ok=True)
+    video_path = os.path.join(data_dir, f"{video_id}.mp4")
+    wav_path = os.path.join(data_dir, f"{video_id}_synthetic.wav")
+    silent_video_path = os.path.join(data_dir, f"{video_id}_silent.mp4")
+
+    cuts = _write_video(silent_video_path, seconds, cut_every, rng)
+    words = _write_transcript(
+        os.path.join(data_dir, f"{video_id}.srt"),
+        os.path.join(data_dir, f"{video_id}_procedure.json"),
+        seconds,
+        rng,
+    )
+    _write_audio(wav_path, seconds, words, rng)
+    if shutil.which("ffmpeg"):
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "quiet", "-y", "-i", silent_video_path, "-i", wav_path,
+             "-c:v", "copy", "-c:a", "aac", "-shortest", video_path],
+            check=True,
+        )
+        os.unlink(silent_video_path)
+    else:
+        os.replace(silent_video_path, video_path)
+    return cuts
+
+
+######## Stubs ########
+# deterministic stand-in for describe_audio_with_gama
+def _stub_gama(latency):
+    def describe_audio_with_gama(audio_clip_path):
+        time.sleep(latency)
+        return f"Sizzling and stirring sounds ({os.path.getsize(audio_clip_path)} bytes of audio)."
+
+    return describe_audio_with_gama
+
+
+class _BenchmarkPipeline(video_parser.VideoPipeline):
+    # without ffmpeg, the synthetic WAV stands in for the decoded track
+    def decode_audio(self):
+        if shutil.which("ffmpeg"):
+            return super().decode_audio()
+        shutil.copyfile(
+            os.path.join(self.data_dir, f"{self.video_id}_synthetic.wav"), self.original_audio_path
+        )
+
+
+######## Benchmarks ########
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench_scene_detection(video_path, cuts, num_workers):
+    key_frames, elapsed = _timed(lambda: detect_key_frames(video_path, num_workers=num_workers))
+    frames = int(cv2.VideoCapture(video_path).get(cv2.CAP_PROP_FRAME_COUNT))
+    return key_frames, {
+        "seconds": round(elapsed, 3),
+        "frames_per_second": round(frames / elapsed, 1),
+        "scenes": len(key_frames),
+        "expected_scenes": cuts + 1,
+    }
+
+
+def bench_frame_lookup(key_frames, duration_ms, num_queries=100000, seed=0):
+    index = KeyFrameIndex()
+    for start, end, _ in key_frames:
+        index.add(start, end, f"{start}_{end}")
+    index.build()
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        start = rng.uniform(0, duration_ms)
+        queries.append((start, start + rng.uniform(500, 10000)))
+    _, elapsed = _timed(lambda: [index.query(start, end) for start, end in queries])
+    return {"seconds": round(elapsed, 3), "queries_per_second": round(num_queries / elapsed)}
+
+
+def bench_audio_slicing(wav_path, num_clips=1000, seed=0):
+    track = AudioTrack(wav_path)
+    rng = random.Random(seed)
+    windows = [
+        (start, start + 10)
+        for start in (rng.uniform(0, max(0.0, track.duration - 10)) for _ in range(num_clips))
+    ]
+    clips, elapsed = _timed(lambda: [track.clip_bytes(start, end) for start, end in windows])
+    return {
+        "seconds": round(elapsed, 3),
+        "clips_per_second": round(num_clips / elapsed),
+        "megabytes_per_second": round(sum(map(len, clips)) / 1e6 / elapsed, 1),
+    }
+
+
+def bench_srt_parsing(srt_path, sentence_path):
+    cues = sum(1 for _ in srt_parser.iter_cues(srt_path))
+    sentences, elapsed = _timed(
+        lambda: srt_parser.save_sentence_json(srt_path, sentence_path, None)
+    )
+    return {
+        "seconds": round(elapsed, 4),
+        "cues_per_second": round(cues / elapsed),
+        "cues": cues,
+        "sentences": sentences,
+    }
+
+
+def bench_end_to_end(videos_dir, video_id, max_workers):
+    pipeline = _BenchmarkPipeline(
+        video_id, videos_dir=videos_dir, max_workers=max_workers, fresh=True, describe_sound=True
+    )
+    summary, elapsed = _timed(pipeline.run)
+    report = json.load(
+        open(os.path.join(pipeline.res_output_dir, f"{video_id}_run_report.json"))
+    )
+    return {
+        "seconds": round(elapsed, 3),
+        "sentences_per_second": round(summary["parsed"] / elapsed, 2),
+        "sentences": summary["parsed"],
+        "sound_calls_saved": summary["sound_calls_saved"],
+        "gpt_calls": report["stages"].get("gpt_call", {}).get("count", 0),
+        "gpt_image_megabytes": round(
+            report["stages"].get("gpt_call", {}).get("image_bytes", 0) / 1e6, 3
+        ),
+        "stage_seconds": {
+            stage: values["seconds_total"] for stage, values in report["stages"].items()
+        },
+    }
+
+
+def run_suite(lengths, cut_every, gpt_latency, gama_latency, max_workers, scene_workers, work_dir):
+    # the stubs: GPT over HTTP through the real OpenAI client, GAMA in-process
+    server = start_stub_server(latency=gpt_latency, capacity=max(64, max_workers), rate_limit_probability=0)
+    secret_path = os.path.join(work_dir, "secret.json")
+    with open(secret_path, "w") as f:
+        json.dump({"OPENAI_KEY": "stub"}, f)
+    video_parser.SECRET_PATH = secret_path
+    video_parser.OPENAI_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    video_parser.USE_RESPONSE_CACHE = False
+    video_parser.SCENE_DETECT_WORKERS = scene_workers
+    video_parser.MODEL_CLIENT_SETTINGS["gpt"]["requests_per_second"] = None
+    video_parser.MODEL_CLIENT_SETTINGS["gama"]["requests_per_second"] = None
+    video_parser.MODEL_CLIENT_SETTINGS["gama"]["max_concurrency"] = max_workers
+    video_parser.describe_audio_with_gama = _stub_gama(gama_latency)
+
+    results = {}
+    try:
+        for seconds in lengths:
+            video_id = f"synthetic_{seconds}s"
+            data_dir = os.path.join(work_dir, video_id)
+            print(f"--> {video_id}: generating...")
+            cuts, generate_seconds = _timed(
+                lambda: make_synthetic_video(work_dir, video_id, seconds, cut_every, seed=seconds)
+            )
+            video_path = os.path.join(data_dir, f"{video_id}.mp4")
+            key_frames, scene_detection = bench_scene_detection(video_path, cuts, scene_workers)
+            results[str(seconds)] = {
+                "generate_seconds": round(generate_seconds, 2),
+                "scene_detection": scene_detection,
+                "frame_lookup": bench_frame_lookup(key_frames, seconds * 1000),
+                "audio_slicing": bench_audio_slicing(
+                    os.path.join(data_dir, f"{video_id}_synthetic.wav")
+                ),
+                "srt_parsing": bench_srt_parsing(
+                    os.path.join(data_dir, f"{video_id}.srt"),
+                    os.path.join(data_dir, f"{video_id}_sentence.json"),
+                ),
+                "end_to_end": bench_end_to_end(work_dir, video_id, max_workers),
+            }
+    finally:
+        server.shutdown()
+    return results
+
+
+HEADLINE_METRICS = (
+    ("scene_detection", "frames_per_second", "scene detection (frames/s)"),
+    ("frame_lookup", "queries_per_second", "frame lookup (queries/s)"),
+    ("audio_slicing", "clips_per_second", "audio slicing (clips/s)"),
+    ("srt_parsing", "cues_per_second", "SRT parsing (cues/s)"),
+    ("end_to_end", "sentences_per_second", "end to end (sentences/s)"),
+    ("end_to_end", "gpt_calls", "GPT calls"),
+    ("end_to_end", "gpt_image_megabytes", "GPT image upload (MB)"),
+)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# the last stored run with the same settings, or None
+def _previous_run(results_path, settings):
+    previous = None
+    if os.path.exists(results_path):
+        with open(results_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    run = json.loads(line)
+                    if run.get("settings") == settings:
+                        previous = run
+    return previous
+
+
+def print_results(results, previous=None):
+    lengths = list(results)
+    header = f"{'metric':<30}" + "".join(f"{f'{length} s':>18}" for length in lengths)
+    print(header)
+    print("-" * len(header))
+    for benchmark, metric, label in HEADLINE_METRICS:
+        cells = []
+        for length in lengths:
+            value = results[length][benchmark][metric]
+            cell = f"{value:,}"
+            old = (previous or {}).get("results", {}).get(length, {}).get(benchmark, {}).get(metric)
+            if old:
+                cell += f" ({value / old - 1:+.0%})"
+            cells.append(f"{cell:>18}")
+        print(f"{label:<30}" + "".join(cells))
+    for length in lengths:
+        scene_detection = results[length]["scene_detection"]
+        print(
+            f"{length} s video: {scene_detection['scenes']} scenes detected for "
+            f"{scene_detection['expected_scenes']} generated"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[30, 120], help="video lengths in seconds")
+    parser.add_argument("--cut_every", type=float, default=4.0, help="mean scene length in seconds")
+    parser.add_argument("--gpt_latency", type=float, default=0.2)
+    parser.add_argument("--gama_latency", type=float, default=0.5)
+    parser.add_argument("--max_workers", type=int, default=8)
+    parser.add_argument("--scene_workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--vision_mode",
+        type=str,
+        default=video_parser.VISION_REQUEST_MODE,
+        choices=("separate", "fused", "batched"),
+    )
+    parser.add_argument("--results", type=str, default=RESULTS_PATH)
+    parser.add_argument("--keep", action="store_true", help="keep the generated videos")
+    args = parser.parse_args()
+
+    settings = {
+        "lengths": args.lengths,
+        "cut_every": args.cut_every,
+        "gpt_latency": args.gpt_latency,
+        "gama_latency": args.gama_latency,
+        "max_workers": args.max_workers,
+        "scene_workers": args.scene_workers,
+        "vision_mode": args.vision_mode,
+        "ffmpeg": shutil.which("ffmpeg") is not None,
+    }
+    video_parser.VISION_REQUEST_MODE = args.vision_mode
+    work_dir = tempfile.mkdtemp(prefix="video_parser_benchmark_")
+    try:
+        results = run_suite(
+            args.lengths,
+            args.cut_every,
+            args.gpt_latency,
+            args.gama_latency,
+            args.max_workers,
+            args.scene_workers,
+            work_dir,
+        )
+    finally:
+        if args.keep:
+            print(f"Generated videos kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    previous = _previous_run(args.results, settings)
+    print_results(results, previous)
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "a") as f:
+        f.write(
+            json.dumps(
+                {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "git_revision": _git_revision(),
+                    "settings": settings,
+                    "results": results,
+                }
+            )
+            + "\n"
+        )
+    print(f"Results appended to {args.results}")
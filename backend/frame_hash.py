@@ -0,0 +1,131 @@
+"""
+Key Frame Deduplication
+
+Collapses near-identical key frames into one representative frame. With a low
+scene detection threshold, a static overhead shot is cut into many scenes whose
+key frames look almost the same; without deduplication each of them is uploaded
+(and billed as vision tokens) for every sentence it overlaps.
+
+Every key frame gets a 64-bit perceptual hash:
+- "dhash": difference hash, the sign of the horizontal gradient of a 9x8
+  grayscale thumbnail; fast, robust to brightness and compression changes
+- "phash": the signs of the 8x8 lowest frequencies of the DCT of a 32x32
+  grayscale thumbnail against their median; more robust to small shifts
+Frames are visited in time order. A frame whose hash is within `max_distance`
+bits (Hamming distance) of an earlier representative joins that representative's
+group, otherwise it becomes a representative itself. Comparing against all
+representatives, not only the previous one, also collapses a shot the video cuts
+back to. The scene intervals of a group all keep pointing to its representative,
+so lookups by time are unchanged, only the frames behind them are shared.
+
+Usage:
+    groups = deduplicate_frames(jpeg_bytes_list, method="dhash", max_distance=5)
+    # -> {representative position: [positions of the frames it stands for]}
+
+Run this file to see how many key frames of a video are near duplicates:
+    python frame_hash.py <video_path> [--method=dhash|phash] [--max_distance=<bits>] [--threshold=<t>]
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+
+HASH_METHODS = ("dhash", "phash")
+_BIT_WEIGHTS = 1 << np.arange(63, -1, -1, dtype=np.uint64)
+_DCT_SIZE = 32
+_DCT_MATRIX = np.cos(
+    np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE)
+)
+
+
+# grayscale thumbnail of an encoded image; JPEGs are decoded at reduced size
+def _thumbnail(image_bytes, size):
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    gray = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        gray = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError("cannot decode image")
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _pack(bits):
+    return int((bits.ravel().astype(np.uint64) * _BIT_WEIGHTS).sum())
+
+
+def dhash(image_bytes):
+    thumbnail = _thumbnail(image_bytes, (9, 8))
+    return _pack(thumbnail[:, 1:] > thumbnail[:, :-1])
+
+
+def phash(image_bytes):
+    thumbnail = _thumbnail(image_bytes, (_DCT_SIZE, _DCT_SIZE))
+    low = (_DCT_MATRIX @ thumbnail @ _DCT_MATRIX.T)[:8, :8].ravel()
+    # the DC term only carries the mean brightness, leave it out of the median
+    return _pack(low > np.median(low[1:]))
+
+
+# 64-bit perceptual hash of an encoded image, as an int
+def image_hash(image_bytes, method="dhash"):
+    if method == "dhash":
+        return dhash(image_bytes)
+    if method == "phash":
+        return phash(image_bytes)
+    raise ValueError(f"unknown hash method {method}")
+
+
+# number of differing bits between one hash and an array of hashes
+def hamming_distances(hash_value, hashes):
+    differing = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(hash_value))
+    return np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+# Group hashes (in time order) within `max_distance` bits of a representative;
+# returns {representative position: [member positions]}, each group in time order
+def group_hashes(hashes, max_distance=5):
+    representatives = []
+    groups = {}
+    for position, hash_value in enumerate(hashes):
+        if representatives:
+            distances = hamming_distances(hash_value, [hashes[r] for r in representatives])
+            nearest = int(distances.argmin())
+            if distances[nearest] <= max_distance:
+                groups[representatives[nearest]].append(position)
+                continue
+        representatives.append(position)
+        groups[position] = [position]
+    return groups
+
+
+# hash the encoded frames (in time order) and group the near-identical ones
+def deduplicate_frames(images, method="dhash", max_distance=5):
+    return group_hashes([image_hash(image, method) for image in images], max_distance)
+
+
+if __name__ == "__main__":
+    from scene_detection import detect_key_frames
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video_path", type=str)
+    parser.add_argument("--method", type=str, default="dhash", choices=HASH_METHODS)
+    parser.add_argument("--max_distance", type=int, default=5, help="Hamming distance in bits (of 64)")
+    parser.add_argument("--threshold", type=float, default=10, help="scene detection threshold")
+    args = parser.parse_args()
+
+    key_frames = detect_key_frames(args.video_path, threshold=args.threshold)
+    groups = deduplicate_frames(
+        [image for _, _, image in key_frames], args.method, args.max_distance
+    )
+    total_bytes = sum(len(image) for _, _, image in key_frames)
+    kept_bytes = sum(len(key_frames[r][2]) for r in groups)
+    print(
+        f"{len(key_frames)} key frames -> {len(groups)} distinct frames "
+        f"({args.method}, max distance {args.max_distance}); "
+        f"{total_bytes / 1e6:.1f} MB -> {kept_bytes / 1e6:.1f} MB of images"
+    )
+    for representative, members in groups.items():
+        if len(members) > 1:
+            intervals = ", ".join(f"{key_frames[m][0]}-{key_frames[m][1]}" for m in members)
+            print(f"  {key_frames[representative][0]} ms: {len(members)} scenes ({intervals})")
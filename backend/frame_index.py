@@ -0,0 +1,92 @@
+"""
+Key Frame Index
+
+Time-interval index over the key frames extracted by the scene detection pass.
+Every key frame covers one scene `[start, end]` (in milliseconds). The index keeps
+the scenes sorted by start time so that the frames overlapping a transcript
+sentence can be found with two binary searches instead of rescanning (and
+re-parsing) the key frame directory for every sentence.
+
+A frame overlaps the query `[startTime, endTime]` when
+    frame_start <= endTime and frame_end >= startTime
+which is the same condition the parser used to spell out as three clauses
+(frame inside the query, frame covering the query start, frame covering the
+query end).
+
+Usage:
+    index = KeyFrameIndex()
+    index.add(start_ms, end_ms, name)
+    ...
+    index.query(startTime, endTime)  # -> list of KeyFrame, sorted by start
+
+Several scenes may share one frame (near-identical key frames are deduplicated,
+see frame_hash.py): they are added with the same name, and query_distinct()
+returns each frame once.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+
+# `name` is the key frame file name, {video_id}_scene_{start}_{end}.{ext}; it is also
+# the key of the frame in the KeyFrameStore
+KeyFrame = namedtuple("KeyFrame", ["start", "end", "name"])
+
+
+class KeyFrameIndex:
+    def __init__(self, frames=()):
+        self._frames = []
+        self._starts = []
+        # running maximum of the end times, so that the first candidate can be
+        # found by bisection even if scenes were to overlap
+        self._max_ends = []
+        self._dirty = False
+        for frame in frames:
+            self.add(*frame)
+
+    def add(self, start, end, name):
+        self._frames.append(KeyFrame(int(start), int(end), name))
+        self._dirty = True
+
+    # sort the frames; called lazily by query(), call it up front before sharing the index across threads
+    def build(self):
+        self._frames.sort(key=lambda frame: (frame.start, frame.end))
+        self._starts = [frame.start for frame in self._frames]
+        self._max_ends = []
+        max_end = None
+        for frame in self._frames:
+            max_end = frame.end if max_end is None else max(max_end, frame.end)
+            self._max_ends.append(max_end)
+        self._dirty = False
+
+    # return the key frames overlapping [startTime, endTime] in O(log n + k)
+    def query(self, startTime, endTime):
+        if self._dirty:
+            self.build()
+        startTime = int(startTime)
+        endTime = int(endTime)
+        first = bisect_left(self._max_ends, startTime)
+        last = bisect_right(self._starts, endTime)
+        return [
+            frame
+            for frame in self._frames[first:last]
+            if frame.end >= startTime
+        ]
+
+    # like query(), but each frame name only once (at its first scene)
+    def query_distinct(self, startTime, endTime):
+        seen = set()
+        frames = []
+        for frame in self.query(startTime, endTime):
+            if frame.name not in seen:
+                seen.add(frame.name)
+                frames.append(frame)
+        return frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        if self._dirty:
+            self.build()
+        return iter(self._frames)
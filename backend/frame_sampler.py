@@ -0,0 +1,133 @@
+"""
+Frame Sampler
+
+Extracts frames at arbitrary timestamps of a video in one forward decode pass.
+Key frames only come from scene cuts, so a sentence inside a long continuous shot
+can overlap a single key frame (taken from the middle of the scene, maybe far
+from the sentence). The sampler fills in frames at chosen points of each such
+sentence (its start, middle and end).
+
+All requested timestamps are mapped to frame numbers, deduplicated and sorted,
+then the video is read forward once: frames in between are only grabbed (decoded
+but not converted), the requested ones are retrieved and JPEG-encoded. There is
+no seek per frame; the capture stays open and later calls with later timestamps
+continue from where the previous one stopped, earlier timestamps reopen the
+video. Encoded frames are kept in a small LRU cache, so neighbouring sentences
+asking for the same frame (the end of one is the start of the next) share it.
+
+Usage:
+    sampler = FrameSampler("video.mp4", cache_size=256)
+    frames = sampler.sample([1200, 3400, 5600])  # {timestamp_ms: (frame_ms, jpeg_bytes)}
+    sampler.close()
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+
+
+# the points of a sentence (times in ms) to sample: start, middle and end for 3
+def sentence_timestamps(startTime, endTime, points=3):
+    start = int(float(startTime))
+    end = int(float(endTime))
+    if points <= 1 or end <= start:
+        return [(start + end) // 2]
+    return [start + (end - start) * i // (points - 1) for i in range(points)]
+
+
+class FrameSampler:
+    def __init__(self, video_path, cache_size=256, jpeg_quality=95):
+        self.video_path = video_path
+        self.cache_size = cache_size
+        self.jpeg_quality = jpeg_quality
+        self._cache = OrderedDict()  # frame number -> jpeg bytes, least recently used first
+        self._capture = None
+        self._position = 0  # number of the next frame the capture returns
+        self._lock = threading.Lock()
+        self.frames_decoded = 0
+        self.cache_hits = 0
+
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise IOError(f"cannot open video {video_path}")
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+
+    def frame_number(self, timestamp_ms):
+        frame_num = max(0, int(round(timestamp_ms * self.fps / 1000)))
+        if self.frame_count > 0:
+            frame_num = min(frame_num, self.frame_count - 1)
+        return frame_num
+
+    def frame_time_ms(self, frame_num):
+        return int(frame_num * 1000 / self.fps)
+
+    # Frames at the timestamps (in ms), as {timestamp_ms: (frame_ms, jpeg_bytes)};
+    # timestamps past the end of the video get the last frame
+    def sample(self, timestamps_ms):
+        targets = {timestamp: self.frame_number(timestamp) for timestamp in timestamps_ms}
+        with self._lock:
+            frames = {}
+            missing = []
+            for frame_num in sorted(set(targets.values())):
+                if frame_num in self._cache:
+                    self._cache.move_to_end(frame_num)
+                    frames[frame_num] = self._cache[frame_num]
+                    self.cache_hits += 1
+                else:
+                    missing.append(frame_num)
+            for frame_num, jpeg_bytes in self._decode(missing):
+                frames[frame_num] = jpeg_bytes
+                self._cache[frame_num] = jpeg_bytes
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return {
+            timestamp: (self.frame_time_ms(frame_num), frames[frame_num])
+            for timestamp, frame_num in targets.items()
+            if frame_num in frames
+        }
+
+    # Read forward over the sorted frame numbers, yields (frame_num, jpeg_bytes); at the
+    # end of the stream the remaining ones get the last frame read
+    def _decode(self, frame_nums):
+        if not frame_nums:
+            return
+        if self._capture is None or frame_nums[0] < self._position:
+            self._reopen()
+        last_image = None
+        for position, frame_num in enumerate(frame_nums):
+            while self._position < frame_num and self._capture.grab():
+                self._position += 1
+                self.frames_decoded += 1
+            ret = self._position == frame_num and self._capture.grab()
+            if ret:
+                ret, last_image = self._capture.retrieve()
+                self._position += 1
+                self.frames_decoded += 1
+            if not ret:
+                if last_image is None:
+                    return
+                for remaining in frame_nums[position:]:
+                    yield remaining, self._encode(last_image)
+                return
+            yield frame_num, self._encode(last_image)
+
+    def _encode(self, image):
+        ret, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ret:
+            raise ValueError("failed to encode frame")
+        return buffer.tobytes()
+
+    def _reopen(self):
+        if self._capture is not None:
+            self._capture.release()
+        self._capture = cv2.VideoCapture(self.video_path)
+        self._position = 0
+
+    def close(self):
+        with self._lock:
+            if self._capture is not None:
+                self._capture.release()
+                self._capture = None
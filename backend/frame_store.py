@@ -0,0 +1,108 @@
+"""
+Key Frame Store
+
+In-memory store of the key frames extracted by the scene detection pass. Each
+frame is base64-encoded exactly once, when it is added, and the encoded payload
+is shared by every prompt that needs it (step description, food and kitchenware
+description, visual scene export, ...), so overlapping sentences no longer
+re-read and re-encode the same image.
+
+The store is bounded by a byte budget (size of the base64 payloads) and evicts
+the least recently used frames first. Evicted frames are not lost: they are
+re-read from their image file, which is either the copy written to `frame_dir`
+(when writing key frames to disk is enabled) or a spill file in a temporary
+directory owned by the store.
+
+Usage:
+    store = KeyFrameStore(max_bytes=256 * 1024 * 1024, frame_dir=None)
+    store.put(key, jpeg_bytes, filename)
+    store.get_base64(key)
+"""
+
+import base64
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class KeyFrameStore:
+    def __init__(self, max_bytes=512 * 1024 * 1024, frame_dir=None):
+        self.max_bytes = max_bytes
+        self.frame_dir = frame_dir
+        self._payloads = OrderedDict()  # key -> base64 str, least recently used first
+        self._paths = {}  # key -> image file backing the frame
+        self._size = 0
+        self._spill_dir = None
+        self._lock = threading.Lock()
+
+    # add an encoded image (e.g. the bytes of a .jpg) under `key`
+    def put(self, key, image_bytes, filename):
+        if self.frame_dir is not None:
+            path = os.path.join(self.frame_dir, filename)
+            with open(path, "wb") as f:
+                f.write(image_bytes)
+            self._paths[key] = path
+        payload = base64.b64encode(image_bytes).decode("utf-8")
+        with self._lock:
+            if key in self._payloads:
+                self._size -= len(self._payloads.pop(key))
+            self._payloads[key] = payload
+            self._size += len(payload)
+            self._evict()
+
+    # return the base64 payload of `key`, reloading it from disk if it was evicted
+    def get_base64(self, key):
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self._payloads.move_to_end(key)
+                return payload
+            path = self._paths.get(key)
+        if path is None:
+            raise KeyError(key)
+        with open(path, "rb") as image_file:
+            payload = base64.b64encode(image_file.read()).decode("utf-8")
+        with self._lock:
+            if key not in self._payloads:
+                self._payloads[key] = payload
+                self._size += len(payload)
+                self._evict()
+        return payload
+
+    # path of the key frame on disk, None if key frames are kept in memory only
+    def get_path(self, key):
+        if self.frame_dir is None:
+            return None
+        return self._paths.get(key)
+
+    # drop least recently used payloads until the store fits in its budget;
+    # a frame without a backing file is spilled to a temporary directory first
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._payloads) > 1:
+            key, payload = self._payloads.popitem(last=False)
+            self._size -= len(payload)
+            if key not in self._paths:
+                if self._spill_dir is None:
+                    self._spill_dir = tempfile.TemporaryDirectory(prefix="key_frames_")
+                path = os.path.join(self._spill_dir.name, f"{len(self._paths)}.bin")
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(payload))
+                self._paths[key] = path
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._payloads or key in self._paths
+
+    def __len__(self):
+        with self._lock:
+            return len(set(self._payloads) | set(self._paths))
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def close(self):
+        if self._spill_dir is not None:
+            self._spill_dir.cleanup()
+            self._spill_dir = None
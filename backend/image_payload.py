@@ -0,0 +1,95 @@
+"""
+Image Payload Preparation
+
+Shrinks the key frames before they are uploaded to the vision model:
+- resize so that the longer edge is at most `max_edge` pixels
+- re-encode as JPEG or WebP with a quality setting
+- limit the number of frames per request, either uniformly over time or by
+  picking the most visually distinct frames
+
+Each key frame is compacted once, when it is added to the key frame store.
+`image_signature` gives a tiny grayscale thumbnail of a frame, used to measure
+how different two frames look for the "distinct" sampling.
+
+Usage:
+    mime_type, data = compact_image(jpeg_bytes, max_edge=768, image_format="jpeg", quality=80)
+    signature = image_signature(data)
+    keep = sample_frames(signatures, max_frames=6, method="distinct")
+"""
+
+import cv2
+import numpy as np
+
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+SIGNATURE_SIZE = 16
+
+
+def _decode(image_bytes):
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("cannot decode image")
+    return image
+
+
+# resize and re-encode an encoded image, returns (mime type, encoded bytes)
+def compact_image(image_bytes, max_edge=768, image_format="jpeg", quality=80):
+    image = _decode(image_bytes)
+    height, width = image.shape[:2]
+    if max_edge and max(height, width) > max_edge:
+        scale = max_edge / max(height, width)
+        image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    if image_format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif image_format == "png":
+        params = []
+    else:
+        raise ValueError(f"unsupported image format {image_format}")
+    ret, buffer = cv2.imencode(f".{image_format}", image, params)
+    if not ret:
+        raise ValueError(f"failed to encode image as {image_format}")
+    return MIME_TYPES[image_format], buffer.tobytes()
+
+
+# normalized 16x16 grayscale thumbnail of an encoded image, as a flat float vector
+def image_signature(image_bytes):
+    gray = cv2.cvtColor(_decode(image_bytes), cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(
+        gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA
+    ).astype(np.float32).ravel()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    return thumbnail / norm if norm else thumbnail
+
+
+# Pick at most `max_frames` of the frames (given in time order), returns their
+# positions in time order.
+# - "uniform": evenly spaced over the list
+# - "distinct": greedy farthest-point selection on the signatures, starting from
+#   the middle frame, so that near-duplicate frames are dropped first
+def sample_frames(signatures, max_frames, method="uniform"):
+    count = len(signatures)
+    if not max_frames or count <= max_frames:
+        return list(range(count))
+    if method == "uniform":
+        return sorted(set(np.linspace(0, count - 1, max_frames).round().astype(int).tolist()))
+    if method != "distinct":
+        raise ValueError(f"unknown sampling method {method}")
+    vectors = np.stack(signatures)
+    chosen = [count // 2]
+    distances = np.linalg.norm(vectors - vectors[chosen[0]], axis=1)
+    while len(chosen) < max_frames:
+        candidate = int(distances.argmax())
+        if distances[candidate] <= 0:
+            break
+        chosen.append(candidate)
+        distances = np.minimum(
+            distances, np.linalg.norm(vectors - vectors[candidate], axis=1)
+        )
+    return sorted(chosen)
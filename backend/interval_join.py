@@ -0,0 +1,154 @@
+"""
+Interval Join
+
+Sweep-line join between two lists of time intervals, used to align transcript
+sentences with procedure annotations. Both lists are walked once in start-time
+order while a heap holds the intervals that are still open, so aligning n
+sentences with m procedures costs O((n + m) log m) instead of O(n * m), and is
+linear apart from the sort when both lists are already in time order (the
+usual case for transcripts and annotations).
+
+Two intervals overlap when
+    interval_start <= query_end and interval_end >= query_start
+For every query the join returns all overlapping intervals, in start order,
+with the overlap ratio = overlap duration / query duration (1.0 for a zero
+length query that lies inside the interval).
+
+Usage:
+    overlap_join([(0, 4), (4, 9)], [(1, 5), (6, 20)])
+    # -> [[(0, 0.75)], [(0, 0.2), (1, 0.6)]]
+    best_overlap([(0, 4), (4, 9)], [(1, 5), (6, 20)])
+    # -> [0, 1]
+
+Run this file to benchmark the join against the nested loop on synthetic data:
+    python interval_join.py --intervals 100000
+"""
+
+import argparse
+import heapq
+import random
+import time
+
+
+def _sorted_order(intervals):
+    order = range(len(intervals))
+    if all(intervals[i][0] <= intervals[i + 1][0] for i in range(len(intervals) - 1)):
+        return list(order)
+    return sorted(order, key=lambda i: intervals[i][0])
+
+
+def _overlap_ratio(query_start, query_end, start, end):
+    length = query_end - query_start
+    if length <= 0:
+        return 1.0
+    return (min(query_end, end) - max(query_start, start)) / length
+
+
+# For each (start, end) query, return [(interval index, overlap ratio)] of all
+# overlapping intervals
+def overlap_join(queries, intervals):
+    query_order = _sorted_order(queries)
+    interval_order = _sorted_order(intervals)
+    results = [[] for _ in queries]
+    active = []  # heap of (end, start order position, interval index)
+    next_interval = 0
+    for q in query_order:
+        query_start, query_end = queries[q]
+        # open every interval that starts before the query ends
+        while (
+            next_interval < len(interval_order)
+            and intervals[interval_order[next_interval]][0] <= query_end
+        ):
+            i = interval_order[next_interval]
+            heapq.heappush(active, (intervals[i][1], next_interval, i))
+            next_interval += 1
+        # close intervals that ended before this query (and thus every later one) starts
+        while active and active[0][0] < query_start:
+            heapq.heappop(active)
+        matches = []
+        for end, position, i in active:
+            start = intervals[i][0]
+            # a longer, earlier query may have opened intervals past this query's end
+            if end >= query_start and start <= query_end:
+                matches.append(
+                    (position, i, _overlap_ratio(query_start, query_end, start, end))
+                )
+        matches.sort()
+        results[q] = [(i, ratio) for _, i, ratio in matches]
+    return results
+
+
+# For each query, the index of the interval covering most of it, or None. Ties go to
+# the earlier interval, so an interval that only touches the query at a boundary
+# (ratio 0) is picked only when no interval overlaps it for a positive duration.
+def best_overlap(queries, intervals):
+    best = []
+    for matches in overlap_join(queries, intervals):
+        best_index, best_ratio = None, None
+        for i, ratio in matches:
+            if best_ratio is None or ratio > best_ratio:
+                best_index, best_ratio = i, ratio
+        best.append(best_index)
+    return best
+
+
+# the straightforward O(n * m) join, kept as reference for the benchmark
+def _nested_loop_join(queries, intervals):
+    by_start = sorted(enumerate(intervals), key=lambda item: item[1][0])
+    results = []
+    for query_start, query_end in queries:
+        results.append(
+            [
+                (i, _overlap_ratio(query_start, query_end, start, end))
+                for i, (start, end) in by_start
+                if start <= query_end and end >= query_start
+            ]
+        )
+    return results
+
+
+# back-to-back intervals with random lengths, like sentences or procedure steps
+def _synthetic_intervals(count, mean_length, seed):
+    rng = random.Random(seed)
+    intervals = []
+    time_cursor = 0.0
+    for _ in range(count):
+        length = rng.expovariate(1 / mean_length)
+        gap = rng.expovariate(1 / (mean_length / 4))
+        intervals.append((time_cursor + gap, time_cursor + gap + length))
+        time_cursor += gap + length
+    return intervals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--intervals", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument(
+        "--check", type=int, default=2000, help="verify against the nested loop on this many queries"
+    )
+    args = parser.parse_args()
+
+    procedures = _synthetic_intervals(args.intervals, 30.0, seed=1)
+    span = procedures[-1][1]
+    sentences = _synthetic_intervals(args.queries, span / args.queries * 0.8, seed=2)
+
+    start = time.perf_counter()
+    joined = overlap_join(sentences, procedures)
+    elapsed = time.perf_counter() - start
+    matched = sum(1 for matches in joined if matches)
+    print(
+        f"sweep join: {args.queries} queries x {args.intervals} intervals in {elapsed * 1000:.1f} ms "
+        f"({matched} queries matched, {sum(len(m) for m in joined)} pairs)"
+    )
+
+    if args.check:
+        sample = sentences[: args.check]
+        start = time.perf_counter()
+        reference = _nested_loop_join(sample, procedures)
+        elapsed_nested = time.perf_counter() - start
+        assert reference == joined[: args.check], "sweep join differs from the nested loop"
+        print(
+            f"nested loop: {args.check} queries in {elapsed_nested * 1000:.1f} ms "
+            f"(~{elapsed_nested * args.queries / args.check:.1f} s extrapolated), results match"
+        )
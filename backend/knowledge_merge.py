@@ -0,0 +1,234 @@
+"""
+Knowledge Merge
+
+Joins sidecar sources onto the segments of an indexed video knowledge file
+({VIDEO_ID}_video_knowledge.jsonl, see knowledge_store.py): sound descriptions,
+re-run vision fields, manual corrections, ...
+
+A source is a stream of records, each holding a key and the fields to set:
+- .jsonl: one JSON object per line (read line by line)
+- .json: a JSON array of objects, e.g. another knowledge file
+- .txt: a sound description log, lines "Time <start>-<end>: <description>" with
+  times in seconds (the format tmp_combine_sound_res.py used to read); other lines
+  are reported, never skipped silently
+A record is matched to a segment
+- by "index": the segment with the same "index"
+- by "segment" [start, end] (ms): the segment containing its midpoint, which
+  is the sentence a centered sound window was cut around
+- by "time" (ms): the segment containing that time
+in that order of preference (or only by time with key="time"). Matching only reads
+the time index, the knowledge pieces are not parsed.
+
+Sources are applied in the given order, so later sources (e.g. manual corrections)
+win. Two records setting the same field of a segment to different values are a
+conflict: the later value is kept and both are reported. Only segments whose
+fields actually change are written, appended to the .jsonl file with their index
+rows repointed (the rest of the file is not rewritten); "index" and "segment"
+are never changed.
+
+Usage:
+    report = merge_sources("v_video_knowledge.jsonl", ["sound.jsonl", "fixes.json"])
+    # -> {"sources": [{"path", "records", "matched", "unmatched", "unmatched_records": [...]}],
+    #     "conflicts": [...], "changed_segments": 12, "changed_fields": 15}
+
+From the command line:
+    python knowledge_merge.py <video_knowledge.jsonl> <source> [<source> ...]
+        [--key=auto|time] [--fields f1 f2] [--export_json=<path>] [--report=<path>] [--dry_run]
+"""
+
+import argparse
+import json
+import os
+import re
+
+from knowledge_store import KnowledgeReader, compact_knowledge, garbage_bytes, update_pieces
+
+
+KEY_FIELDS = ("index", "segment", "time")
+_SOUND_LOG_LINE = re.compile(
+    r"^Time\s*\[?\s*(\d+(?:\.\d+)?)\s*s?\s*(?:-|to)\s*(\d+(?:\.\d+)?)\s*s?\s*\]?\s*:\s*(.*)$"
+)
+# unmatched records listed per source in the report
+MAX_REPORTED = 100
+
+
+# (line number, record or None, reason) for every record of a source
+def read_source(path):
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line), None
+                except json.JSONDecodeError as error:
+                    yield line_number, None, f"invalid JSON: {error}"
+    elif path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        for position, record in enumerate(records):
+            yield position, record, None
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                match = _SOUND_LOG_LINE.match(line)
+                if match is None:
+                    yield line_number, None, f"unrecognized line: {line[:80]}"
+                    continue
+                description = match.group(3)
+                if "Audio caption: " in description:
+                    description = description.split("Audio caption: ", 1)[1]
+                yield line_number, {
+                    "segment": [float(match.group(1)) * 1000, float(match.group(2)) * 1000],
+                    "environment_sound_description": description,
+                }, None
+
+
+class _Matcher:
+    def __init__(self, reader, key):
+        self.reader = reader
+        self.key = key
+
+    def _by_index(self, index):
+        try:
+            return self.reader.position_of(int(index))
+        except (TypeError, ValueError):
+            return None
+
+    def _by_time(self, time_ms):
+        located = self.reader.locate(time_ms, time_ms)
+        # on a boundary between two segments, the later one starts there
+        return located[-1][0] if located else None
+
+    # position of the segment a record belongs to, or (None, reason)
+    def match(self, record):
+        if not isinstance(record, dict):
+            return None, "not an object"
+        if self.key == "auto" and "index" in record:
+            position = self._by_index(record["index"])
+            if position is None:
+                return None, f"no segment with index {record['index']!r}"
+            return position, None
+        try:
+            if "segment" in record:
+                start, end = (float(t) for t in record["segment"])
+                time_ms = (start + end) / 2
+            elif "time" in record:
+                time_ms = float(record["time"])
+            else:
+                return None, "no index, segment or time"
+        except (TypeError, ValueError):
+            return None, "invalid segment or time"
+        position = self._by_time(time_ms)
+        if position is None:
+            return None, f"no segment at {time_ms:.0f} ms"
+        return position, None
+
+
+# Merge the sources into the knowledge file; returns the report (see the module docstring)
+def merge_sources(jsonl_path, source_paths, key="auto", fields=None, dry_run=False):
+    report = {"sources": [], "conflicts": [], "changed_segments": 0, "changed_fields": 0}
+    # position -> field -> (value, source path, line)
+    updates = {}
+    with KnowledgeReader(jsonl_path) as reader:
+        matcher = _Matcher(reader, key)
+        for path in source_paths:
+            summary = {
+                "path": path,
+                "records": 0,
+                "matched": 0,
+                "unmatched": 0,
+                "unmatched_records": [],
+            }
+            for line, record, reason in read_source(path):
+                summary["records"] += 1
+                position = None
+                if record is not None:
+                    position, reason = matcher.match(record)
+                if position is None:
+                    summary["unmatched"] += 1
+                    if len(summary["unmatched_records"]) < MAX_REPORTED:
+                        summary["unmatched_records"].append({"line": line, "reason": reason})
+                    continue
+                summary["matched"] += 1
+                piece_updates = updates.setdefault(position, {})
+                for field, value in record.items():
+                    if field in KEY_FIELDS or (fields and field not in fields):
+                        continue
+                    previous = piece_updates.get(field)
+                    if previous is not None and previous[0] != value:
+                        report["conflicts"].append(
+                            {
+                                "position": position,
+                                "field": field,
+                                "kept": {"source": path, "line": line, "value": value},
+                                "replaced": {
+                                    "source": previous[1],
+                                    "line": previous[2],
+                                    "value": previous[0],
+                                },
+                            }
+                        )
+                    piece_updates[field] = (value, path, line)
+            report["sources"].append(summary)
+
+        # only the segments whose fields actually change are rewritten
+        changed = {}
+        for position, piece_updates in updates.items():
+            piece = reader[position]
+            changes = {
+                field: value
+                for field, (value, _, _) in piece_updates.items()
+                if piece.get(field) != value
+            }
+            if changes:
+                piece.update(changes)
+                changed[position] = piece
+                report["changed_fields"] += len(changes)
+        report["changed_segments"] = len(changed)
+    if changed and not dry_run:
+        update_pieces(jsonl_path, changed)
+        # rewrite the file once the replaced lines outweigh the live ones
+        if garbage_bytes(jsonl_path) * 2 > os.path.getsize(jsonl_path):
+            compact_knowledge(jsonl_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("knowledge_path", type=str, help="{VIDEO_ID}_video_knowledge.jsonl")
+    parser.add_argument("sources", type=str, nargs="+", help=".jsonl, .json or sound log .txt")
+    parser.add_argument("--key", type=str, default="auto", choices=("auto", "time"))
+    parser.add_argument("--fields", type=str, nargs="+", default=None, help="only merge these fields")
+    parser.add_argument("--export_json", type=str, default=None, help="also write the knowledge JSON here")
+    parser.add_argument("--report", type=str, default=None, help="write the full report as JSON")
+    parser.add_argument("--dry_run", action="store_true")
+    args = parser.parse_args()
+
+    report = merge_sources(args.knowledge_path, args.sources, args.key, args.fields, args.dry_run)
+    for summary in report["sources"]:
+        print(
+            f"{summary['path']}: {summary['matched']} of {summary['records']} records matched, "
+            f"{summary['unmatched']} unmatched"
+        )
+        for unmatched in summary["unmatched_records"][:10]:
+            print(f"  line {unmatched['line']}: {unmatched['reason']}")
+    for conflict in report["conflicts"][:10]:
+        print(
+            f"conflict at segment {conflict['position']} {conflict['field']}: "
+            f"{conflict['kept']['source']}:{conflict['kept']['line']} replaces "
+            f"{conflict['replaced']['source']}:{conflict['replaced']['line']}"
+        )
+    print(
+        f"{len(report['conflicts'])} conflicts; {report['changed_fields']} fields of "
+        f"{report['changed_segments']} segments {'would change' if args.dry_run else 'changed'}."
+    )
+    if args.export_json:
+        with KnowledgeReader(args.knowledge_path) as reader:
+            reader.to_json(args.export_json)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,333 @@
+"""
+Knowledge Search
+
+Local retrieval over the segments of a video knowledge file, so a prompt only
+needs the few segments relevant to a question instead of the whole video.
+
+Each knowledge piece is indexed as one document made of its text fields
+(transcript, procedure, step and food and kitchenware descriptions, weighted by
+FIELD_WEIGHTS) and scored with Okapi BM25. Text is lowercased, split into words,
+stop words are dropped and a plural "s" is stripped. The index is a set of
+NumPy posting lists (per term: the documents containing it and its precomputed
+BM25 weight in each), so a question costs one vectorized add per query term and
+a partial sort; no network, no model.
+
+Indexes are saved as {VIDEO_ID}_knowledge_index.npz next to the knowledge file
+(the parser builds one at the end of every run) and are rebuilt by the query
+service when the knowledge file is newer.
+
+Usage:
+    index = KnowledgeSearchIndex.build(pieces)
+    index.search("how long do I fry the onions?", k=5)
+    # -> [{"index": 12, "segment": [40500, 44200], "score": 7.3}, ...]
+    index.save("v_knowledge_index.npz")
+    index = KnowledgeSearchIndex.load("v_knowledge_index.npz")
+
+From the command line:
+    python knowledge_search.py build <video_knowledge.json|.jsonl>
+    python knowledge_search.py query <video_knowledge.json|.jsonl> "<question>" [--k=<n>]
+    python knowledge_search.py serve [--videos_dir=<dir>] [--port=<port>]
+The service answers GET /search?video_id=<id>&q=<question>&k=<n> with
+{"video_id": ..., "segments": [{"index", "segment", "score"}, ...], "milliseconds": ...}
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+FIELD_WEIGHTS = {
+    "video_transcript": 1.0,
+    "procedure_description": 1.0,
+    "step_description": 1.0,
+    "food_and_kitchenware_description": 1.0,
+}
+STOPWORDS = frozenset(
+    """a about above after again all am an and any are as at be been before being below
+    between both but by can could did do does doing down during each few for from further
+    had has have having he her here hers him his how i if in into is it its itself just me
+    more most my no nor not now of off on once only or other our out over own s same she
+    should so some such t than that the their them then there these they this those through
+    to too under until up very was we were what when where which while who whom why will
+    with would you your""".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    tokens = []
+    for token in _WORD.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+# the pieces of a knowledge file, either the JSON array or the indexed JSON Lines
+def load_pieces(knowledge_path):
+    if knowledge_path.endswith(".jsonl"):
+        from knowledge_store import KnowledgeReader
+
+        with KnowledgeReader(knowledge_path) as reader:
+            return list(reader)
+    with open(knowledge_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def index_path_for(knowledge_path):
+    base = os.path.splitext(knowledge_path)[0]
+    if base.endswith("_video_knowledge"):
+        base = base[: -len("_video_knowledge")]
+    return f"{base}_knowledge_index.npz"
+
+
+class KnowledgeSearchIndex:
+    def __init__(self, vocabulary, offsets, documents, weights, piece_indices, segments):
+        self.vocabulary = vocabulary  # term -> term id
+        self.offsets = offsets  # postings of term t: offsets[t]:offsets[t + 1]
+        self.documents = documents
+        self.weights = weights
+        self.piece_indices = piece_indices
+        self.segments = segments
+
+    @classmethod
+    def build(cls, pieces, field_weights=None, k1=1.2, b=0.75):
+        field_weights = field_weights or FIELD_WEIGHTS
+        vocabulary = {}
+        term_ids, document_ids, frequencies = [], [], []
+        lengths = np.zeros(len(pieces), np.float32)
+        for document, piece in enumerate(pieces):
+            counts = Counter()
+            for field, weight in field_weights.items():
+                for token in tokenize(str(piece.get(field) or "")):
+                    counts[token] += weight
+            for token, count in counts.items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                document_ids.append(document)
+                frequencies.append(count)
+            lengths[document] = sum(counts.values())
+
+        term_ids = np.asarray(term_ids, np.int64)
+        documents = np.asarray(document_ids, np.int32)
+        frequencies = np.asarray(frequencies, np.float32)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, documents, frequencies = term_ids[order], documents[order], frequencies[order]
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary))
+        offsets = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+
+        num_documents = len(pieces)
+        idf = np.log1p((num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = float(lengths.mean()) if num_documents and lengths.mean() > 0 else 1.0
+        normalization = k1 * (1 - b + b * lengths[documents] / average_length)
+        weights = (
+            idf[term_ids] * frequencies * (k1 + 1) / (frequencies + normalization)
+        ).astype(np.float32)
+
+        piece_indices = np.asarray(
+            [piece.get("index", position) for position, piece in enumerate(pieces)], np.int64
+        )
+        segments = np.asarray(
+            [[int(float(t)) for t in piece.get("segment", (0, 0))] for piece in pieces], np.int64
+        ).reshape(-1, 2)
+        return cls(vocabulary, offsets, documents, weights, piece_indices, segments)
+
+    # The k best matching segments for the question, best first; segments that
+    # share no term with it are left out
+    def search(self, question, k=5):
+        scores = np.zeros(len(self.piece_indices), np.float32)
+        for token in set(tokenize(question)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            # a term occurs at most once per document, no duplicate indices here
+            scores[self.documents[start:end]] += self.weights[start:end]
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            {
+                "index": int(self.piece_indices[document]),
+                "segment": self.segments[document].tolist(),
+                "score": round(float(scores[document]), 4),
+            }
+            for document in candidates
+        ]
+
+    def save(self, path):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.asarray(terms, dtype=str),
+            offsets=self.offsets,
+            documents=self.documents,
+            weights=self.weights,
+            piece_indices=self.piece_indices,
+            segments=self.segments,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocabulary = {str(term): i for i, term in enumerate(data["terms"])}
+            return cls(
+                vocabulary,
+                data["offsets"],
+                data["documents"],
+                data["weights"],
+                data["piece_indices"],
+                data["segments"],
+            )
+
+    def __len__(self):
+        return len(self.piece_indices)
+
+
+# build and save the index of a knowledge file, returns the index
+def build_index(knowledge_path, index_path=None):
+    index = KnowledgeSearchIndex.build(load_pieces(knowledge_path))
+    index.save(index_path or index_path_for(knowledge_path))
+    return index
+
+
+######## Query service ########
+class SearchService:
+    def __init__(self, videos_dir):
+        self.videos_dir = videos_dir
+        self._indexes = {}  # video_id -> (knowledge file mtime, index)
+        self._lock = threading.Lock()
+
+    def _knowledge_path(self, video_id):
+        res_dir = os.path.join(self.videos_dir, video_id, "parser_res")
+        for extension in (".jsonl", ".json"):
+            path = os.path.join(res_dir, f"{video_id}_video_knowledge{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    # the index of a video, loaded once, rebuilt when the knowledge file changed
+    def index(self, video_id):
+        if os.path.basename(video_id) != video_id or video_id in ("", ".", ".."):
+            return None
+        knowledge_path = self._knowledge_path(video_id)
+        if knowledge_path is None:
+            return None
+        mtime = os.path.getmtime(knowledge_path)
+        with self._lock:
+            cached = self._indexes.get(video_id)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            index_path = index_path_for(knowledge_path)
+            if os.path.exists(index_path) and os.path.getmtime(index_path) >= mtime:
+                index = KnowledgeSearchIndex.load(index_path)
+            else:
+                index = build_index(knowledge_path, index_path)
+            self._indexes[video_id] = (mtime, index)
+            return index
+
+
+class _SearchHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/search":
+            return self._reply(404, {"error": "not found"})
+        query = urllib.parse.parse_qs(url.query)
+        video_id = query.get("video_id", [""])[0]
+        question = query.get("q", [""])[0]
+        try:
+            k = int(query.get("k", ["5"])[0])
+        except ValueError:
+            return self._reply(400, {"error": "k must be an integer"})
+        if not question:
+            return self._reply(400, {"error": "missing q"})
+        start = time.perf_counter()
+        index = self.server.service.index(video_id)
+        if index is None:
+            return self._reply(404, {"error": f"no video knowledge for {video_id!r}"})
+        segments = index.search(question, k=max(1, k))
+        self._reply(
+            200,
+            {
+                "video_id": video_id,
+                "segments": segments,
+                "milliseconds": round((time.perf_counter() - start) * 1000, 3),
+            },
+        )
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        # the web client calls the service from the browser
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(videos_dir, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), _SearchHandler)
+    server.daemon_threads = True
+    server.service = SearchService(videos_dir)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the search index of a knowledge file")
+    build.add_argument("knowledge_path", type=str)
+    query = commands.add_parser("query", help="print the best segments for a question")
+    query.add_argument("knowledge_path", type=str)
+    query.add_argument("question", type=str)
+    query.add_argument("--k", type=int, default=5)
+    serve = commands.add_parser("serve", help="answer GET /search?video_id=&q=&k=")
+    serve.add_argument(
+        "--videos_dir",
+        type=str,
+        default=os.path.join(os.path.dirname(__file__), "data", "videos_study"),
+    )
+    serve.add_argument("--host", type=str, default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index(args.knowledge_path)
+        print(f"Indexed {len(index)} segments, {len(index.vocabulary)} terms.")
+    elif args.command == "query":
+        index_path = index_path_for(args.knowledge_path)
+        if os.path.exists(index_path):
+            index = KnowledgeSearchIndex.load(index_path)
+        else:
+            index = build_index(args.knowledge_path, index_path)
+        start = time.perf_counter()
+        segments = index.search(args.question, k=args.k)
+        elapsed = time.perf_counter() - start
+        pieces = {piece.get("index"): piece for piece in load_pieces(args.knowledge_path)}
+        for segment in segments:
+            piece = pieces.get(segment["index"], {})
+            print(f"[{segment['index']}] {segment['segment']} score {segment['score']}: {piece.get('video_transcript', '')}")
+        print(f"({elapsed * 1000:.2f} ms)")
+    else:
+        server = make_server(args.videos_dir, args.host, args.port)
+        print(f"Serving video knowledge search on http://{args.host}:{args.port}/search")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,351 @@
+"""
+Indexed Video Knowledge
+
+Compact, time-indexed form of a video knowledge file. Next to
+{VIDEO_ID}_video_knowledge.json the parser writes
+- {VIDEO_ID}_video_knowledge.jsonl: one knowledge piece per line (compact JSON,
+  UTF-8), in the same order as the JSON array
+- {VIDEO_ID}_video_knowledge.idx: a binary sidecar with one fixed-width row per
+  piece: segment start and end (ms), the running maximum of the ends, the
+  piece's position and "index", and the byte offset and length of its line in
+  the .jsonl file
+Both files are memory-mapped by the reader. A time query binary-searches the
+rows of the index in place (O(log n)) and parses only the lines of the pieces it
+returns, so reading one segment of a multi-hour video costs about the same as
+reading one of a short video. The JSON array is derived from the .jsonl file
+byte for byte (see to_json()).
+
+Pieces are updated in place (see update_pieces(), used by knowledge_merge.py):
+the new version of a changed piece is appended to the .jsonl file and its index
+row is repointed to it, so the rest of the file is neither parsed nor rewritten.
+The old lines stay behind as garbage until compact_knowledge() rewrites the file.
+
+A piece covers the time range of its "segment" [start, end] (ms); pieces are
+usually contiguous and in time order, but any order and overlaps are allowed:
+    piece_start <= query_end and piece_end >= query_start
+
+Usage:
+    write_knowledge(pieces, "v_video_knowledge.jsonl")   # also writes v_video_knowledge.idx
+    with KnowledgeReader("v_video_knowledge.jsonl") as reader:
+        reader.at(93500)             # -> pieces covering 93.5 s
+        reader.range(60000, 120000)  # -> pieces overlapping the second minute
+        reader.to_json("v_video_knowledge.json")
+
+From the command line:
+    python knowledge_store.py convert <video_knowledge.json>
+    python knowledge_store.py query <video_knowledge.jsonl> <start_ms> [<end_ms>]
+    python knowledge_store.py export <video_knowledge.jsonl> <output.json>
+    python knowledge_store.py benchmark [--hours 1 4] [--queries=<n>]
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+
+
+INDEX_MAGIC = b"VKIDX001"
+# magic, number of rows; the rows follow, sorted by start
+_HEADER = struct.Struct("<8sQ")
+# start ms, end ms, running max end ms, position in the JSON array, "index" of the
+# piece, byte offset and byte length of its line in the .jsonl file
+_ROW = struct.Struct("<qqqQqQQ")
+
+
+def index_path_for(jsonl_path):
+    return os.path.splitext(jsonl_path)[0] + ".idx"
+
+
+# segment [start, end] of a piece in ms; the parser writes them as numbers or strings
+def segment_ms(piece):
+    start, end = piece["segment"]
+    return int(float(start)), int(float(end))
+
+
+# Write the pieces as JSON Lines plus the sidecar index; both files are replaced atomically
+def write_knowledge(pieces, jsonl_path, index_path=None):
+    index_path = index_path or index_path_for(jsonl_path)
+    rows = []
+    offset = 0
+    with open(f"{jsonl_path}.tmp", "wb") as f:
+        for position, piece in enumerate(pieces):
+            line = (
+                json.dumps(piece, ensure_ascii=False, separators=(",", ":")) + "\n"
+            ).encode("utf-8")
+            f.write(line)
+            start, end = segment_ms(piece)
+            piece_index = int(piece.get("index", position))
+            rows.append((start, end, position, piece_index, offset, len(line)))
+            offset += len(line)
+    rows.sort(key=lambda row: (row[0], row[1], row[2]))
+    with open(f"{index_path}.tmp", "wb") as f:
+        f.write(_HEADER.pack(INDEX_MAGIC, len(rows)))
+        max_end = None
+        for start, end, position, piece_index, offset, length in rows:
+            max_end = end if max_end is None else max(max_end, end)
+            f.write(_ROW.pack(start, end, max_end, position, piece_index, offset, length))
+    os.replace(f"{jsonl_path}.tmp", jsonl_path)
+    os.replace(f"{index_path}.tmp", index_path)
+    return len(rows)
+
+
+# convert an existing {VIDEO_ID}_video_knowledge.json, returns the .jsonl path
+def convert_json(json_path, jsonl_path=None):
+    jsonl_path = jsonl_path or os.path.splitext(json_path)[0] + ".jsonl"
+    with open(json_path, "r", encoding="utf-8") as f:
+        write_knowledge(json.load(f), jsonl_path)
+    return jsonl_path
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class KnowledgeReader:
+    def __init__(self, jsonl_path, index_path=None):
+        self._data = _map(jsonl_path)
+        self._index = _map(index_path or index_path_for(jsonl_path))
+        magic, self._count = _HEADER.unpack_from(self._index, 0)
+        self._position_rows = None
+        self._index_positions = None
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"not a video knowledge index: {index_path or jsonl_path}")
+
+    def _row(self, i):
+        return _ROW.unpack_from(self._index, _HEADER.size + i * _ROW.size)
+
+    # row number of every position, built on first use
+    def _rows_by_position(self):
+        if self._position_rows is None:
+            position_rows = [0] * self._count
+            for i in range(self._count):
+                position_rows[self._row(i)[3]] = i
+            self._position_rows = position_rows
+        return self._position_rows
+
+    # first row with column `field` > value (bisect_right) or >= value (bisect_left)
+    def _bisect(self, field, value, right):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            current = self._row(middle)[field]
+            if current < value or (right and current == value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _piece(self, row):
+        offset, length = row[5], row[6]
+        return json.loads(self._data[offset : offset + length])
+
+    # index rows of the pieces overlapping [start_ms, end_ms], in time order
+    def _overlapping(self, start_ms, end_ms):
+        first = self._bisect(2, start_ms, right=False)  # running max end >= start
+        last = self._bisect(0, end_ms, right=True)  # start <= end
+        return [row for row in map(self._row, range(first, last)) if row[1] >= start_ms]
+
+    # Pieces overlapping [start_ms, end_ms], in time order: O(log n + k) index rows read
+    def range(self, start_ms, end_ms):
+        return [self._piece(row) for row in self._overlapping(start_ms, end_ms)]
+
+    # like range(), but only (position, start ms, end ms) of the pieces, nothing is parsed
+    def locate(self, start_ms, end_ms):
+        return [(row[3], row[0], row[1]) for row in self._overlapping(start_ms, end_ms)]
+
+    # pieces covering the timestamp (ms)
+    def at(self, timestamp_ms):
+        return self.range(timestamp_ms, timestamp_ms)
+
+    # position of the piece with this "index" (sentenceIndex), None if there is none
+    def position_of(self, index):
+        if self._index_positions is None:
+            self._index_positions = {}
+            for i in range(self._count):
+                row = self._row(i)
+                self._index_positions.setdefault(row[4], row[3])
+        return self._index_positions.get(index)
+
+    # the piece at `position` of the original JSON array
+    def __getitem__(self, position):
+        if not 0 <= position < self._count:
+            raise IndexError(position)
+        return self._piece(self._row(self._rows_by_position()[position]))
+
+    def __len__(self):
+        return self._count
+
+    # all pieces, in the order of the original JSON array
+    def __iter__(self):
+        for i in self._rows_by_position():
+            yield self._piece(self._row(i))
+
+    # write the pieces as the parser's JSON array (json.dump with indent=4)
+    def to_json(self, json_path):
+        with open(json_path, "w") as f:
+            json.dump(list(self), f, indent=4)
+
+    def close(self):
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Replace pieces ({position: piece}) without rewriting the file: each new version is
+# appended to the .jsonl file, then its index row is repointed to it. The segment of
+# a piece cannot change, its index row would have to move.
+def update_pieces(jsonl_path, pieces, index_path=None):
+    index_path = index_path or index_path_for(jsonl_path)
+    with KnowledgeReader(jsonl_path, index_path) as reader:
+        position_rows = reader._rows_by_position()
+        rows = {
+            position: (position_rows[position], reader._row(position_rows[position]))
+            for position in pieces
+        }
+    with open(jsonl_path, "ab") as f:
+        offset = f.tell()
+        pointers = []
+        for position, piece in sorted(pieces.items()):
+            row_number, row = rows[position]
+            if segment_ms(piece) != (row[0], row[1]):
+                raise ValueError(f"the segment of piece {position} cannot change")
+            line = (
+                json.dumps(piece, ensure_ascii=False, separators=(",", ":")) + "\n"
+            ).encode("utf-8")
+            f.write(line)
+            pointers.append((row_number, offset, len(line)))
+            offset += len(line)
+        f.flush()
+        os.fsync(f.fileno())
+    # the new lines are on disk before any row points to them
+    with open(index_path, "r+b") as f:
+        for row_number, offset, length in pointers:
+            f.seek(_HEADER.size + row_number * _ROW.size + _ROW.size - 16)
+            f.write(struct.pack("<QQ", offset, length))
+    return len(pointers)
+
+
+# bytes of the .jsonl file no longer referenced by the index (left by update_pieces)
+def garbage_bytes(jsonl_path, index_path=None):
+    with KnowledgeReader(jsonl_path, index_path) as reader:
+        live = sum(reader._row(i)[6] for i in range(len(reader)))
+    return os.path.getsize(jsonl_path) - live
+
+
+# rewrite the .jsonl file and its index without the replaced lines
+def compact_knowledge(jsonl_path, index_path=None):
+    with KnowledgeReader(jsonl_path, index_path) as reader:
+        pieces = list(reader)
+    return write_knowledge(pieces, jsonl_path, index_path)
+
+
+######## Benchmark ########
+# a knowledge file like the parser's, one sentence every 2-6 seconds
+def _synthetic_pieces(hours, seed=0):
+    rng = random.Random(seed)
+    words = "the chef stirs diced onions in a hot pan with olive oil until golden brown".split()
+    pieces = []
+    start = 0
+    while start < hours * 3600 * 1000:
+        end = start + rng.randint(2000, 6000)
+        pieces.append(
+            {
+                "index": len(pieces),
+                "segment": [start, str(end)],
+                "video_transcript": " ".join(rng.choices(words, k=12)),
+                "procedure_description": " ".join(rng.choices(words, k=8)),
+                "step_description": " ".join(rng.choices(words, k=40)),
+                "food_and_kitchenware_description": " ".join(rng.choices(words, k=60)),
+                "environment_sound_description": " ".join(rng.choices(words, k=20)),
+            }
+        )
+        start = end
+    return pieces
+
+
+def _benchmark(hours_list, num_queries):
+    print(
+        f"{'video':>8}{'pieces':>9}{'JSON MB':>9}{'json.load ms':>14}{'open+query ms':>15}"
+        f"{'query us':>10}{'export ok':>11}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for hours in hours_list:
+            pieces = _synthetic_pieces(hours)
+            json_path = os.path.join(tmp_dir, f"{hours}h_video_knowledge.json")
+            with open(json_path, "w") as f:
+                json.dump(pieces, f, indent=4)
+            jsonl_path = convert_json(json_path)
+            duration = segment_ms(pieces[-1])[1]
+            rng = random.Random(1)
+            queries = [rng.uniform(0, duration) for _ in range(num_queries)]
+
+            # what a consumer does today: load everything, scan for the segment
+            start = time.perf_counter()
+            with open(json_path, "r") as f:
+                loaded = json.load(f)
+            full_found = [
+                piece for piece in loaded if segment_ms(piece)[0] <= queries[0] <= segment_ms(piece)[1]
+            ]
+            full_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with KnowledgeReader(jsonl_path) as reader:
+                found = reader.at(queries[0])
+                first_seconds = time.perf_counter() - start
+                assert found == full_found
+                start = time.perf_counter()
+                for timestamp in queries:
+                    reader.at(timestamp)
+                query_seconds = (time.perf_counter() - start) / num_queries
+                export_path = os.path.join(tmp_dir, "export.json")
+                reader.to_json(export_path)
+            with open(json_path, "rb") as a, open(export_path, "rb") as b:
+                identical = a.read() == b.read()
+            print(
+                f"{f'{hours:g} h':>8}{len(pieces):>9}{os.path.getsize(json_path) / 1e6:>9.1f}"
+                f"{full_seconds * 1000:>14.1f}{first_seconds * 1000:>15.3f}"
+                f"{query_seconds * 1e6:>10.1f}{str(identical):>11}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="write the indexed form of a knowledge JSON")
+    convert.add_argument("json_path", type=str)
+    query = commands.add_parser("query", help="print the pieces overlapping a time range")
+    query.add_argument("jsonl_path", type=str)
+    query.add_argument("start_ms", type=float)
+    query.add_argument("end_ms", type=float, nargs="?")
+    export = commands.add_parser("export", help="write the knowledge JSON from the indexed form")
+    export.add_argument("jsonl_path", type=str)
+    export.add_argument("json_path", type=str)
+    benchmark = commands.add_parser("benchmark", help="compare with json.load on synthetic videos")
+    benchmark.add_argument("--hours", type=float, nargs="+", default=[0.5, 2, 6])
+    benchmark.add_argument("--queries", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        print(f"Wrote {convert_json(args.json_path)}")
+    elif args.command == "query":
+        with KnowledgeReader(args.jsonl_path) as reader:
+            end_ms = args.start_ms if args.end_ms is None else args.end_ms
+            print(json.dumps(reader.range(args.start_ms, end_ms), indent=4, ensure_ascii=False))
+    elif args.command == "export":
+        with KnowledgeReader(args.jsonl_path) as reader:
+            reader.to_json(args.json_path)
+    else:
+        _benchmark(args.hours, args.queries)
@@ -0,0 +1,222 @@
+"""
+Model Client
+
+Resilience layer shared by all remote model calls (GPT over the OpenAI API, GAMA
+over Gradio). One ModelClient per service wraps every call with
+- a token bucket that caps the request rate
+- an adaptive (AIMD) concurrency limit: it grows by one slot per limit's worth
+  of successful calls, halves on a rate-limit error (HTTP 429) and shrinks by 10%
+  when a call takes longer than `latency_target` seconds
+- retries of rate-limit and transient errors (timeouts, connection errors, 5xx)
+  with jittered exponential backoff, honouring Retry-After when the server sends it
+Connection pooling comes from reusing one long-lived SDK client per service
+(see video_parser.get_openai_client / get_gama_client); ModelClient only wraps
+the calls.
+
+Usage:
+    gpt = ModelClient("gpt", requests_per_second=5, max_concurrency=16)
+    response = gpt.call(openai_client.chat.completions.create, model=..., messages=...)
+    print(gpt.stats())
+
+To try the layer against injected latency and rate-limit errors, see
+stub_model_server.py.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+import urllib.error
+
+
+logger = logging.getLogger("model_client")
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+_TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "ConnectError",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "RemoteProtocolError",
+}
+_RATE_LIMIT_MESSAGE = re.compile(r"\b429\b|rate.?limit|too many requests", re.IGNORECASE)
+
+
+# "rate_limited", "transient" or None (not worth retrying) for an exception
+# raised by the OpenAI SDK, the Gradio client, httpx or urllib
+def classify_error(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if status == 429 or type(error).__name__ == "RateLimitError":
+        return RATE_LIMITED
+    if isinstance(status, int) and (status >= 500 or status == 408):
+        return TRANSIENT
+    if isinstance(error, (ConnectionError, TimeoutError, urllib.error.URLError)) and not isinstance(
+        status, int
+    ):
+        return TRANSIENT
+    if type(error).__name__ in _TRANSIENT_ERROR_NAMES:
+        return TRANSIENT
+    # the Gradio client reports errors of the Space only as text
+    if status is None and _RATE_LIMIT_MESSAGE.search(str(error)):
+        return RATE_LIMITED
+    return None
+
+
+# seconds from a Retry-After header of the error's response, if any
+def retry_after(error):
+    headers = getattr(error, "headers", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # block until a token is available and take it
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=None):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    # wait for a free slot, returns the start time to pass to release()
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    # give the slot back and adapt the limit to how the call went
+    def release(self, start, rate_limited=False, succeeded=True):
+        with self._condition:
+            self.in_flight -= 1
+            latency = time.monotonic() - start
+            slow = self.latency_target is not None and latency > self.latency_target
+            if rate_limited or slow:
+                # calls started before the last decrease saw the old limit, so a
+                # burst of errors from the same overload only shrinks it once
+                if start > self._last_decrease:
+                    factor = 0.5 if rate_limited else 0.9
+                    self.limit = max(self.minimum, self.limit * factor)
+                    self._last_decrease = time.monotonic()
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ModelClient:
+    def __init__(
+        self,
+        name,
+        requests_per_second=None,
+        initial_concurrency=4,
+        max_concurrency=32,
+        latency_target=None,
+        max_retries=6,
+        base_delay=1.0,
+        max_delay=60.0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.limiter = AdaptiveLimiter(
+            initial=min(initial_concurrency, max_concurrency),
+            maximum=max_concurrency,
+            latency_target=latency_target,
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+        self._local = threading.local()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    # full jitter: uniform in [0, base * 2^attempt], capped
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    # Call fn(*args, **kwargs) within the rate and concurrency limits, retrying
+    # rate-limit and transient errors; other errors are raised right away
+    def call(self, fn, *args, **kwargs):
+        self._count("calls")
+        self._local.retries = 0
+        for attempt in range(self.max_retries + 1):
+            self._local.retries = attempt
+            if self.bucket is not None:
+                self.bucket.acquire()
+            start = self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as error:
+                kind = classify_error(error)
+                self.limiter.release(start, rate_limited=kind == RATE_LIMITED, succeeded=False)
+                if kind == RATE_LIMITED:
+                    self._count("rate_limited")
+                if kind is None or attempt == self.max_retries:
+                    self._count("failed")
+                    raise
+                delay = retry_after(error)
+                delay = self._backoff(attempt) if delay is None else min(delay, self.max_delay)
+                self._count("retries")
+                logger.info(
+                    "%s: %s error (%r), retry %d in %.1f s",
+                    self.name,
+                    kind,
+                    error,
+                    attempt + 1,
+                    delay,
+                )
+                time.sleep(delay)
+                continue
+            self.limiter.release(start)
+            return result
+
+    # retries of the last call made on this thread
+    @property
+    def last_retries(self):
+        return getattr(self._local, "retries", 0)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["concurrency_limit"] = int(self.limiter.limit)
+        return stats
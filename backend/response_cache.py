@@ -0,0 +1,133 @@
+"""
+Model Response Cache
+
+Content-addressed, disk-backed cache for model calls (GPT-4o image analysis,
+GAMA sound description). A response is stored under the SHA-256 of everything
+that determines it: model name, prompt text and the raw image/audio bytes. A
+re-run of the parser therefore only calls the API for the requests whose inputs
+actually changed, e.g. after editing a single prompt only that field is
+recomputed.
+
+Entries are small JSON files in `cache_dir/<2 hex>/<key>.json`. The cache is
+bounded by `max_bytes`; when it grows past the budget the least recently used
+entries (by file modification time, refreshed on every hit) are deleted.
+The cache keeps hit/miss counters for the current process.
+
+The model call itself is passed in as a function, so the cache can be exercised
+offline with a stub in place of the real client:
+
+    cache = ResponseCache("/tmp/cache")
+    key = cache.make_key("stub-model", "prompt", b"image bytes")
+    cache.get_or_call(key, lambda: "stub response")
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    # hash the model name, prompt and payloads (str or bytes) into a cache key
+    @staticmethod
+    def make_key(model, prompt, *payloads):
+        digest = hashlib.sha256()
+        for part in (model, prompt) + payloads:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            # length prefix, so that ("ab", "c") and ("a", "bc") differ
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    # (path, mtime, size) of every entry on disk
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".json"):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    # return the cached response, or None on a miss
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)["response"]
+        except (FileNotFoundError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"response": value})
+        # write to a temporary file first so that a crash never leaves a half-written entry
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data.encode("utf-8")) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    # return the cached response for `key`, or call `fn()` and cache its result;
+    # on a hit, `on_hit(seconds)` gets the time the lookup took
+    def get_or_call(self, key, fn, on_hit=None):
+        start = time.perf_counter()
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            self.put(key, value)
+        elif on_hit is not None:
+            on_hit(time.perf_counter() - start)
+        return value
+
+    # delete least recently used entries until the cache is back to 90% of its budget
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._size <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size_bytes": self._size,
+            }
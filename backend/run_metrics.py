@@ -0,0 +1,222 @@
+"""
+Run Metrics
+
+Instrumentation of a parser run: wall time and counters (tokens, bytes
+uploaded, cache hits, retries, ...) per stage, overall and per sentence.
+
+    metrics = RunMetrics("mixdagZ-fwI_core")
+    with metrics.stage("scene_detection"):
+        ...
+    with metrics.for_sentence(12), metrics.stage("gpt_call") as counters:
+        ...
+        counters["prompt_tokens"] += 1234
+
+Stages record the sentence set with for_sentence() on the current thread, if any.
+Code deep in a call (e.g. the GPT request) reaches the metrics of the running
+pipeline through current(); outside a run it gets a throwaway instance.
+
+At the end of a run, also of a failed one, the metrics are written as
+- a JSON run report: per-stage totals and percentiles, and per-sentence details
+- a Prometheus textfile (for node_exporter's textfile collector), one
+  `video_parser_stage_*` series per stage and counter, labelled by video_id
+and summarized in a table that compares every stage with the previous report
+of the same video, so regressions are visible across runs.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class RunMetrics:
+    def __init__(self, video_id):
+        self.video_id = video_id
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._durations = defaultdict(list)
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._sentences = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        self.extra = {}
+
+    # attribute the stages run on this thread to a sentence
+    @contextmanager
+    def for_sentence(self, sentence_index):
+        previous = getattr(self._local, "sentence", None)
+        self._local.sentence = sentence_index
+        try:
+            yield
+        finally:
+            self._local.sentence = previous
+
+    # Time a stage; the yielded dict collects counters for it
+    @contextmanager
+    def stage(self, name):
+        counters = defaultdict(float)
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            self.add(name, time.perf_counter() - start, **counters)
+
+    # record one run of a stage that took `seconds`, with its counters
+    def add(self, name, seconds, **counters):
+        sentence = getattr(self._local, "sentence", None)
+        with self._lock:
+            self._durations[name].append(seconds)
+            for key, value in counters.items():
+                self._counters[name][key] += value
+            if sentence is not None:
+                details = self._sentences[sentence][name]
+                details["seconds"] += seconds
+                for key, value in counters.items():
+                    details[key] += value
+
+    def report(self):
+        with self._lock:
+            stages = {}
+            for name, durations in self._durations.items():
+                ordered = sorted(durations)
+                stages[name] = {
+                    "count": len(ordered),
+                    "seconds_total": round(sum(ordered), 4),
+                    "seconds_mean": round(sum(ordered) / len(ordered), 4),
+                    "seconds_p50": round(ordered[len(ordered) // 2], 4),
+                    "seconds_p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+                    "seconds_max": round(ordered[-1], 4),
+                    **{key: _number(value) for key, value in self._counters[name].items()},
+                }
+            sentences = {
+                str(sentence): {
+                    name: {key: _number(value) for key, value in details.items()}
+                    for name, details in stage_details.items()
+                }
+                for sentence, stage_details in sorted(self._sentences.items())
+            }
+        return {
+            "video_id": self.video_id,
+            "started": self.started,
+            "wall_seconds": round(time.perf_counter() - self._start, 3),
+            "stages": stages,
+            "sentences": sentences,
+            **self.extra,
+        }
+
+    # Write the JSON report and the Prometheus textfile, print the summary table
+    # (compared with the `previous` report, if given); returns the report
+    def save(self, report_path, prometheus_path=None, previous=None):
+        report = self.report()
+        _write_atomic(report_path, json.dumps(report, indent=4))
+        if prometheus_path:
+            _write_atomic(prometheus_path, prometheus_text(report))
+        print(summary_table(report, previous))
+        return report
+
+
+# a saved report, or None if there is none (or it is unreadable)
+def load_report(report_path):
+    try:
+        with open(report_path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else round(value, 4)
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _metric_name(key):
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in key)
+
+
+# the report in the Prometheus text exposition format
+def prometheus_text(report):
+    labels = 'video_id="{}"'.format(report["video_id"].replace("\\", "\\\\").replace('"', '\\"'))
+    lines = [
+        "# HELP video_parser_run_seconds Wall time of the last parser run.",
+        "# TYPE video_parser_run_seconds gauge",
+        f"video_parser_run_seconds{{{labels}}} {report['wall_seconds']}",
+        "# HELP video_parser_run_timestamp_seconds Start time of the last parser run.",
+        "# TYPE video_parser_run_timestamp_seconds gauge",
+        f"video_parser_run_timestamp_seconds{{{labels}}} {report['started']:.3f}",
+        "# HELP video_parser_run_failed Whether the last parser run failed.",
+        "# TYPE video_parser_run_failed gauge",
+        f"video_parser_run_failed{{{labels}}} {int(report.get('status') == 'failed')}",
+    ]
+    series = defaultdict(list)
+    for stage, values in sorted(report["stages"].items()):
+        stage_labels = f'{labels},stage="{stage}"'
+        for key, value in values.items():
+            if key.startswith("seconds_") and key != "seconds_total":
+                series[f"video_parser_stage_{key}"].append((stage_labels, value))
+            elif key == "count":
+                series["video_parser_stage_calls"].append((stage_labels, value))
+            else:
+                series[f"video_parser_stage_{_metric_name(key)}"].append((stage_labels, value))
+    for name, samples in sorted(series.items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{{{sample_labels}}} {value}" for sample_labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+# Table of the stages, with the change of total time against a previous report
+def summary_table(report, previous=None):
+    previous_stages = (previous or {}).get("stages", {})
+    header = (
+        f"{'stage':<18}{'calls':>7}{'total s':>10}{'mean s':>9}{'p95 s':>9}"
+        f"{'tokens in/out':>16}{'MB up':>8}{'hits':>6}{'retries':>8}{'vs last':>9}"
+    )
+    lines = [
+        f"Run report for {report['video_id']} ({report['wall_seconds']:.1f} s wall)",
+        header,
+        "-" * len(header),
+    ]
+    for stage, values in sorted(
+        report["stages"].items(), key=lambda item: -item[1]["seconds_total"]
+    ):
+        tokens = ""
+        if "prompt_tokens" in values or "completion_tokens" in values:
+            tokens = f"{values.get('prompt_tokens', 0)}/{values.get('completion_tokens', 0)}"
+        uploaded = values.get("image_bytes", 0) + values.get("audio_bytes", 0)
+        change = ""
+        if stage in previous_stages and previous_stages[stage]["seconds_total"]:
+            ratio = values["seconds_total"] / previous_stages[stage]["seconds_total"] - 1
+            change = f"{ratio:+.0%}"
+        lines.append(
+            f"{stage:<18}{values['count']:>7}{values['seconds_total']:>10.2f}"
+            f"{values['seconds_mean']:>9.3f}{values['seconds_p95']:>9.3f}{tokens:>16}"
+            f"{uploaded / 1e6 if uploaded else 0:>8.2f}{values.get('cache_hits', 0):>6}"
+            f"{values.get('retries', 0):>8}{change:>9}"
+        )
+    return "\n".join(lines)
+
+
+_current = None
+_current_lock = threading.Lock()
+
+
+# the metrics of the running pipeline, or a throwaway instance outside a run
+def current():
+    global _current
+    with _current_lock:
+        if _current is None:
+            _current = RunMetrics("")
+        return _current
+
+
+def set_current(metrics):
+    global _current
+    with _current_lock:
+        _current = metrics
@@ -0,0 +1,179 @@
+"""
+Sentence Segmenter
+
+Incremental sentence segmentation of a word stream. Words are pushed one at a
+time with their start and end times (in milliseconds) and every sentence is
+returned as soon as it is complete, so live captions can be parsed while the
+session is still going. srt_parser.py runs finished SRT files through the same
+engine.
+
+A sentence ends
+- at a word ending with ".", "?" or "!" (optionally followed by closing quotes or
+  brackets), except for abbreviations like "e.g." or "Dr." and decimal numbers
+  like "3.5"
+- before a word that starts after a silence of at least `silence_gap_ms`
+- before a word that would make the sentence longer than `max_sentence_ms`
+- when the stream is flushed, so trailing words without punctuation are kept
+For a live stream, tick(now_ms) closes the open sentence once the speaker has
+been silent for `silence_gap_ms`, without waiting for the next word.
+
+Sentences have the same format as the sentence JSON files:
+    {"sentenceIndex": 1, "text": "Add the onions. ", "startTime": "1000", "endTime": "2300"}
+
+Usage:
+    segmenter = SentenceSegmenter(max_sentence_ms=30000, silence_gap_ms=2000)
+    for text, start_ms, end_ms in words:
+        for sentence in segmenter.push(text, start_ms, end_ms):
+            ...
+    for sentence in segmenter.flush():
+        ...
+
+Run this file to segment a live stream of JSON word events, one per line on stdin
+({"text": ..., "startTime": ..., "endTime": ...}), printing sentences as JSON lines:
+    python sentence_segmenter.py [--max_sentence_seconds=<s>] [--silence_gap_seconds=<s>]
+and with --check to run the segmentation regression cases (CHECK_CASES).
+"""
+
+import argparse
+import json
+import re
+import sys
+
+
+TERMINAL_PUNCTUATION = ".?!"
+CLOSING_CHARACTERS = "\"')]}”’"
+# lower-case, without the final period. Only abbreviations that never end a spoken
+# sentence: words like "no", "etc", "min" or "oz" often do ("Is it done? No.")
+ABBREVIATIONS = frozenset(["e.g", "i.e", "vs", "approx", "mr", "mrs", "ms", "dr"])
+# initialisms like "U.S." or "a.m."
+_INITIALISM = re.compile(r"^(?:[A-Za-z]\.){2,}$")
+
+
+# whether a word ends a sentence
+def is_sentence_end(word):
+    word = word.strip().rstrip(CLOSING_CHARACTERS)
+    if not word or word[-1] not in TERMINAL_PUNCTUATION:
+        return False
+    if word[-1] != ".":
+        return True
+    if word.endswith(".."):
+        return True  # ellipsis
+    if word[:-1].lower() in ABBREVIATIONS or _INITIALISM.match(word):
+        return False
+    return True
+
+
+class SentenceSegmenter:
+    def __init__(self, max_sentence_ms=None, silence_gap_ms=None, start_index=1):
+        self.max_sentence_ms = max_sentence_ms
+        self.silence_gap_ms = silence_gap_ms
+        self.next_index = start_index
+        self._text = ""
+        self._start = None
+        self._end = None
+
+    # whether some words are waiting for the end of their sentence
+    @property
+    def pending(self):
+        return self._start is not None
+
+    # Add one word, returns the sentences completed by it (usually none or one)
+    def push(self, text, start_ms, end_ms):
+        completed = []
+        if self._start is not None and (
+            (self.silence_gap_ms is not None and start_ms - self._end >= self.silence_gap_ms)
+            or (self.max_sentence_ms is not None and end_ms - self._start > self.max_sentence_ms)
+        ):
+            completed.extend(self.flush())
+        if self._start is None:
+            self._start = start_ms
+        self._text += text + " "
+        self._end = end_ms
+        if is_sentence_end(text):
+            completed.extend(self.flush())
+        return completed
+
+    # Close the open sentence if nothing was said for `silence_gap_ms` before `now_ms`
+    def tick(self, now_ms):
+        if (
+            self._start is not None
+            and self.silence_gap_ms is not None
+            and now_ms - self._end >= self.silence_gap_ms
+        ):
+            return self.flush()
+        return []
+
+    # Close the open sentence, returns it (or nothing if no words are waiting)
+    def flush(self):
+        if self._start is None:
+            return []
+        sentence = {
+            "sentenceIndex": self.next_index,
+            "text": self._text,
+            "startTime": str(self._start),
+            "endTime": str(self._end),
+        }
+        self.next_index += 1
+        self._text = ""
+        self._start = None
+        self._end = None
+        return [sentence]
+
+
+# Segment a finished stream of word records ({"text", "startTime", "endTime"})
+def segment_words(words, max_sentence_ms=None, silence_gap_ms=None):
+    segmenter = SentenceSegmenter(max_sentence_ms, silence_gap_ms)
+    for word in words:
+        yield from segmenter.push(word["text"], int(word["startTime"]), int(word["endTime"]))
+    yield from segmenter.flush()
+
+
+def _seconds_to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+# text -> expected sentences, for --check
+CHECK_CASES = [
+    ("Is it done? No. Keep stirring.", ["Is it done?", "No.", "Keep stirring."]),
+    ("Add the salt, pepper, etc. Then stir.", ["Add the salt, pepper, etc.", "Then stir."]),
+    ("Cook for 5 min. Flip it.", ["Cook for 5 min.", "Flip it."]),
+    ("Add 2 oz. Mix well.", ["Add 2 oz.", "Mix well."]),
+    ("Use a deep pan, e.g. a wok.", ["Use a deep pan, e.g. a wok."]),
+    ("Ask Dr. Smith about U.S. flour.", ["Ask Dr. Smith about U.S. flour."]),
+    ("Add 3.5 cups. Wait... Then stir", ["Add 3.5 cups.", "Wait...", "Then stir"]),
+    ('He said "done." Serve it.', ['He said "done."', "Serve it."]),
+]
+
+
+def _check():
+    for text, expected in CHECK_CASES:
+        words = [
+            {"text": word, "startTime": i * 500, "endTime": i * 500 + 400}
+            for i, word in enumerate(text.split())
+        ]
+        sentences = [sentence["text"].strip() for sentence in segment_words(words)]
+        assert sentences == expected, f"{text!r} segmented as {sentences}"
+    print(f"{len(CHECK_CASES)} segmentation cases passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_sentence_seconds", type=float, default=None)
+    parser.add_argument("--silence_gap_seconds", type=float, default=None)
+    parser.add_argument("--check", action="store_true", help="run the segmentation cases and exit")
+    args = parser.parse_args()
+    if args.check:
+        _check()
+        sys.exit(0)
+
+    segmenter = SentenceSegmenter(
+        _seconds_to_ms(args.max_sentence_seconds), _seconds_to_ms(args.silence_gap_seconds)
+    )
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        word = json.loads(line)
+        for sentence in segmenter.push(word["text"], int(word["startTime"]), int(word["endTime"])):
+            print(json.dumps(sentence), flush=True)
+    for sentence in segmenter.flush():
+        print(json.dumps(sentence), flush=True)
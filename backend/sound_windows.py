@@ -0,0 +1,113 @@
+"""
+Sound Windows
+
+Schedules the audio windows that are described for the sentences of a video.
+Every sentence is described from a window of at least 10 seconds centered on
+it, so neighbouring short sentences ask for heavily overlapping clips. The
+scheduler snaps each window onto a grid of windows starting every `stride`
+seconds, choosing the grid window closest to the centered one that still
+covers the whole sentence. Sentences that share a grid window share one model
+call.
+
+With stride=None every sentence keeps its exact centered window (the original
+behaviour), only identical windows are merged.
+
+Usage:
+    scheduler = SoundWindowScheduler(stride=5.0)
+    windows = scheduler.schedule(sentences)  # {(start, end): [sentence positions]}
+    print(scheduler.report())
+
+Run this file to see how many model calls a transcript saves:
+    python sound_windows.py <sentence_json> [--stride=<s>] [--length=<s>]
+"""
+
+import argparse
+import json
+import math
+
+
+WINDOW_SECONDS = 10
+_EPSILON = 1e-9
+
+
+# The audio window described for a sentence (times in ms), in seconds: clips
+# shorter than 10 seconds are extended equally on both sides to exactly 10 seconds
+def sound_clip_window(startTime, endTime, length=WINDOW_SECONDS):
+    transcript_start_seconds = float(startTime) / 1000
+    transcript_end_seconds = float(endTime) / 1000
+    if transcript_end_seconds - transcript_start_seconds < length:
+        time_to_add = (length - (transcript_end_seconds - transcript_start_seconds)) / 2
+        return transcript_start_seconds - time_to_add, transcript_end_seconds + time_to_add
+    return transcript_start_seconds, transcript_end_seconds
+
+
+# The grid window (start = k * stride, k >= 0) for a sentence between `start` and
+# `end` seconds: the `length` long window nearest to the centered one that covers
+# the sentence, or for sentences too long for that, the sentence rounded out to
+# the grid
+def snap_window(start, end, stride, length=WINDOW_SECONDS):
+    lowest = max(0, math.ceil((end - length) / stride - _EPSILON))
+    highest = math.floor(start / stride + _EPSILON)
+    if lowest <= highest:
+        centered = round(((start + end) / 2 - length / 2) / stride)
+        k = min(max(centered, lowest), highest)
+        return k * stride, k * stride + length
+    first = math.floor(start / stride + _EPSILON) * stride
+    last = math.ceil(end / stride - _EPSILON) * stride
+    return first, max(last, first + length)
+
+
+class SoundWindowScheduler:
+    def __init__(self, stride=5.0, length=WINDOW_SECONDS):
+        self.stride = stride
+        self.length = length
+        self.num_sentences = 0
+        self.num_windows = 0
+
+    # the window of one sentence (times in ms), in seconds
+    def window(self, startTime, endTime):
+        if not self.stride:
+            return sound_clip_window(startTime, endTime, self.length)
+        return snap_window(
+            float(startTime) / 1000, float(endTime) / 1000, self.stride, self.length
+        )
+
+    # Map every distinct window to the positions of the sentences it describes,
+    # windows in time order
+    def schedule(self, sentences):
+        windows = {}
+        for position, sentence in enumerate(sentences):
+            window = self.window(sentence["startTime"], sentence["endTime"])
+            windows.setdefault(window, []).append(position)
+        self.num_sentences = len(sentences)
+        self.num_windows = len(windows)
+        return dict(sorted(windows.items()))
+
+    def report(self):
+        return {
+            "sentences": self.num_sentences,
+            "windows": self.num_windows,
+            "calls_saved": self.num_sentences - self.num_windows,
+            "stride": self.stride,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sentence_json", type=str)
+    parser.add_argument("--stride", type=float, default=5.0, help="grid stride in seconds, 0 for exact windows")
+    parser.add_argument("--length", type=float, default=WINDOW_SECONDS)
+    args = parser.parse_args()
+
+    with open(args.sentence_json) as f:
+        sentences = json.load(f)
+    exact = SoundWindowScheduler(stride=None, length=args.length)
+    exact.schedule(sentences)
+    scheduler = SoundWindowScheduler(stride=args.stride, length=args.length)
+    scheduler.schedule(sentences)
+    report = scheduler.report()
+    print(
+        f"{report['sentences']} sentences: {exact.num_windows} distinct exact windows, "
+        f"{report['windows']} windows on a {args.stride:g} s grid "
+        f"({report['calls_saved']} of {report['sentences']} model calls saved)"
+    )
@@ -1,104 +1,307 @@
-import pysrt
 import json
 import argparse
+import codecs
 import os
+import re
+import tempfile
+import time
+from json.encoder import encode_basestring_ascii
+
+from sentence_segmenter import segment_words
 
 """
 SRT Parser Script
 
 This script parses SRT subtitle files and converts them to JSON format. It provides two main functionalities:
 
-1. Word-level parsing: Converts each subtitle entry in an SRT file to JSON format with caption index, 
+1. Word-level parsing: Converts each subtitle entry in an SRT file to JSON format with caption index,
    text content, start time, and end time in milliseconds.
 
-2. Sentence-level parsing: Groups word-level subtitles into sentences (based on punctuation like 
-   periods, question marks, and exclamation points) and creates a JSON file with sentence index, 
+2. Sentence-level parsing: Groups word-level subtitles into sentences (based on punctuation like
+   periods, question marks, and exclamation points, optionally also on silences and a maximum
+   sentence length, see sentence_segmenter.py) and creates a JSON file with sentence index,
    text content, start time, and end time.
 
+The file is streamed: cues are parsed one at a time, fed straight into the sentence
+grouper and written out as they come, so memory use does not grow with the length
+of the transcript. The default "json" output is formatted like json.dump(indent=4);
+"jsonl" (one record per line) and "compact" (JSON without whitespace) are
+smaller and faster to write.
+
 Usage:
     python srt_parser.py --srt_word_input=<srt_file> --json_sentence_output=<sentence_json_file> --json_word_output=<word_json_file>
+                         [--output_format=json|jsonl|compact]
+                         [--max_sentence_seconds=<s>] [--silence_gap_seconds=<s>]
 
 If run directly, the script uses default filenames in the same directory as the script.
+Benchmark the parser on a synthetic SRT file with one million cues:
+    python srt_parser.py --benchmark 1000000
 """
 
 
-def parse_srt(srt_word_input, json_word_output):
-    # Load the SRT file
-    subtitles = pysrt.open(srt_word_input)
+OUTPUT_FORMATS = ("json", "jsonl", "compact")
+TIMESTAMP_SEPARATOR = "-->"
+_TIME_SEP = re.compile(r"\:|\.|\,")
+_INTEGER = re.compile(r"^(\d+)")
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf_32"),
+    (codecs.BOM_UTF32_BE, "utf_32"),
+    (codecs.BOM_UTF8, "utf_8_sig"),
+    (codecs.BOM_UTF16_LE, "utf_16"),
+    (codecs.BOM_UTF16_BE, "utf_16"),
+)
 
-    # Create an empty list to store the results
-    results = []
 
-    # Iterate over each subtitle in the file
-    for caption_idx, subtitle in enumerate(subtitles):
-        # Convert the start and end times to milliseconds
-        start_time = (
-            subtitle.start.hours * 60 * 60 * 1000
-            + subtitle.start.minutes * 60 * 1000
-            + subtitle.start.seconds * 1000
-            + subtitle.start.milliseconds
-        )
-        end_time = (
-            subtitle.end.hours * 60 * 60 * 1000
-            + subtitle.end.minutes * 60 * 1000
-            + subtitle.end.seconds * 1000
-            + subtitle.end.milliseconds
+def _parse_int(digits):
+    try:
+        return int(digits)
+    except ValueError:
+        match = _INTEGER.match(digits)
+        return int(match.group()) if match else 0
+
+
+# "HH:MM:SS,mmm" to milliseconds; the fixed-width form is decoded by slicing,
+# anything else (1-digit hours, "." separators, stray characters) the way pysrt does
+def parse_timestamp(timestamp):
+    if len(timestamp) == 12:
+        try:
+            return (
+                int(timestamp[0:2]) * 3600000
+                + int(timestamp[3:5]) * 60000
+                + int(timestamp[6:8]) * 1000
+                + int(timestamp[9:12])
+            )
+        except ValueError:
+            pass
+    parts = _TIME_SEP.split(timestamp)
+    if len(parts) != 4:
+        raise ValueError(f"invalid timestamp {timestamp!r}")
+    hours, minutes, seconds, milliseconds = (_parse_int(part) for part in parts)
+    return hours * 3600000 + minutes * 60000 + seconds * 1000 + milliseconds
+
+
+def _detect_encoding(srt_path):
+    with open(srt_path, "rb") as f:
+        first_bytes = f.read(4)
+    for bom, encoding in _BOMS:
+        if first_bytes.startswith(bom):
+            return encoding
+    return "utf_8"
+
+
+# (start, end, text) of one cue from its lines, None if the cue is malformed
+def _parse_cue(lines):
+    if len(lines) < 2:
+        return None
+    lines = [line.rstrip() for line in lines]
+    if TIMESTAMP_SEPARATOR not in lines[0]:
+        lines.pop(0)  # the cue number
+    timestamps = lines[0].split(TIMESTAMP_SEPARATOR)
+    if len(timestamps) != 2:
+        return None
+    # the end time may be followed by position coordinates
+    end = timestamps[1].lstrip().split(" ", 1)[0]
+    try:
+        return (
+            parse_timestamp(timestamps[0].strip()),
+            parse_timestamp(end.strip()),
+            "\n".join(lines[1:]),
         )
+    except ValueError:
+        return None
+
+
+# Yield (start ms, end ms, text) for every cue of an SRT file, one at a time.
+# Malformed cues are skipped, like pysrt does by default.
+def iter_cues(srt_path, encoding=None):
+    with open(srt_path, "r", encoding=encoding or _detect_encoding(srt_path)) as f:
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            elif lines:
+                cue = _parse_cue(lines)
+                if cue is not None:
+                    yield cue
+                lines = []
+        if lines:
+            cue = _parse_cue(lines)
+            if cue is not None:
+                yield cue
+
+
+# Yield the word-level records, times are strings of milliseconds
+def iter_words(srt_word_input):
+    for caption_idx, (start_time, end_time, text) in enumerate(iter_cues(srt_word_input)):
+        yield {
+            "caption_idx": caption_idx,
+            "text": text,
+            "startTime": str(start_time),
+            "endTime": str(end_time),
+        }
+
+
+# Group word records into sentences, see sentence_segmenter.py
+def group_sentences(words, max_sentence_ms=None, silence_gap_ms=None):
+    return segment_words(words, max_sentence_ms, silence_gap_ms)
+
+
+# Writes records one at a time as
+# - "json": a list, byte for byte what json.dump(records, f, indent=4) writes
+# - "jsonl": one compact record per line
+# - "compact": a list without whitespace
+# A writer without a path discards the records.
+class RecordWriter:
+    def __init__(self, path, output_format="json"):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unknown output format {output_format}")
+        self.output_format = output_format
+        self.count = 0
+        self._file = open(path, "w") if path else None
+
+    def write(self, record):
+        if self._file is None:
+            self.count += 1
+            return
+        if self.output_format == "json":
+            prefix = "[\n    " if self.count == 0 else ",\n    "
+            self._file.write(prefix + _indented(record))
+        elif self.output_format == "jsonl":
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        else:
+            prefix = "[" if self.count == 0 else ","
+            self._file.write(prefix + json.dumps(record, separators=(",", ":")))
+        self.count += 1
+
+    def close(self):
+        if self._file is None:
+            return
+        if self.output_format == "json":
+            self._file.write("[]" if self.count == 0 else "\n]")
+        elif self.output_format == "compact":
+            self._file.write("[]" if self.count == 0 else "]")
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
 
-        # Add the text, start time, and end time to the results list
-        results.append(
-            {
-                "caption_idx": caption_idx,
-                "text": subtitle.text,
-                "startTime": str(start_time),
-                "endTime": str(end_time),
-            }
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# json.dumps(record, indent=4) of a list item, one level deeper. Flat records
+# (all of ours) are formatted here, json.dumps with indent runs the slow pure
+# Python encoder.
+def _indented(record):
+    if any(isinstance(value, (dict, list, tuple)) for value in record.values()):
+        return json.dumps(record, indent=4).replace("\n", "\n    ")
+    if not record:
+        return "{}"
+    return (
+        "{\n        "
+        + ",\n        ".join(
+            encode_basestring_ascii(str(key)) + ": "
+            + (encode_basestring_ascii(value) if isinstance(value, str) else json.dumps(value))
+            for key, value in record.items()
         )
-    
-    # save results to json
-    if (json_word_output):
-        with open(json_word_output, "w") as f:
-            json.dump(results, f, indent=4)
+        + "\n    }"
+    )
+
+
+def _written(records, writer):
+    for record in records:
+        writer.write(record)
+        yield record
+
 
-    return results
+def parse_srt(srt_word_input, json_word_output, output_format="json"):
+    # Parse the SRT file and save results to json, returns the word-level records
+    with RecordWriter(json_word_output, output_format) as word_writer:
+        return list(_written(iter_words(srt_word_input), word_writer))
 
 
 # This function is used for converting a word-level srt file into a sentence-level json file
-def save_sentence_json(srt_word_input, json_sentence_output, json_word_output):
-    srt_parsed = parse_srt(srt_word_input, json_word_output)
-
-    sentences_list =[]
-    current_sentence_start_time = -1
-    current_sentence_end_time = -1
-    current_sentence_text = ""
-    current_sentence_index = 1
-
-    for item in srt_parsed:
-        word = item["text"]
-        current_sentence_text += word + " "
-
-        if (current_sentence_start_time == -1):
-            current_sentence_start_time = item["startTime"]
-        
-        if "." in word or "?" in word or "!" in word:
-            current_sentence_end_time = item["endTime"]
-            sentences_list.append({
-                "sentenceIndex": current_sentence_index,
-                "text": current_sentence_text,
-                "startTime": current_sentence_start_time,
-                "endTime": current_sentence_end_time
-            })
-            current_sentence_start_time = -1
-            current_sentence_end_time = -1
-            current_sentence_index += 1
-            current_sentence_text = ""
-    
-    # save sentences_list to json
-    if(json_sentence_output):
-        with open(json_sentence_output, "w") as f:
-            json.dump(sentences_list, f, indent=4)
-
-    return False
+# in a single streaming pass; returns the number of sentences
+def save_sentence_json(
+    srt_word_input,
+    json_sentence_output,
+    json_word_output,
+    output_format="json",
+    max_sentence_ms=None,
+    silence_gap_ms=None,
+):
+    with RecordWriter(json_word_output, output_format) as word_writer, RecordWriter(
+        json_sentence_output, output_format
+    ) as sentence_writer:
+        words = _written(iter_words(srt_word_input), word_writer)
+        for sentence in group_sentences(words, max_sentence_ms, silence_gap_ms):
+            sentence_writer.write(sentence)
+    return sentence_writer.count
+
+
+# the original pysrt-based word parsing, kept as reference for the benchmark
+def _pysrt_words(srt_word_input):
+    import pysrt
+
+    return [
+        {
+            "caption_idx": caption_idx,
+            "text": subtitle.text,
+            "startTime": str(subtitle.start.ordinal),
+            "endTime": str(subtitle.end.ordinal),
+        }
+        for caption_idx, subtitle in enumerate(pysrt.open(srt_word_input))
+    ]
+
+
+# one word per cue, ~300 ms each, a sentence end every 12 words
+def _write_synthetic_srt(path, num_cues):
+    def timestamp(ms):
+        return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+    words = ("add", "the", "chopped", "onions", "to", "pan", "and", "stir", "for", "minute", "or", "two")
+    with open(path, "w") as f:
+        for i in range(num_cues):
+            word = words[i % len(words)] + ("." if i % len(words) == len(words) - 1 else "")
+            f.write(f"{i + 1}\n{timestamp(i * 300)} --> {timestamp(i * 300 + 280)}\n{word}\n\n")
+
+
+def _benchmark(num_cues, output_format, check):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        srt_path = os.path.join(tmp_dir, "synthetic.srt")
+        _write_synthetic_srt(srt_path, num_cues)
+        size_mb = os.path.getsize(srt_path) / 1e6
+
+        start = time.perf_counter()
+        num_sentences = sum(1 for _ in group_sentences(iter_words(srt_path)))
+        elapsed = time.perf_counter() - start
+        print(
+            f"parse + group: {num_cues} cues ({size_mb:.1f} MB) -> {num_sentences} sentences in "
+            f"{elapsed:.2f} s ({num_cues / elapsed:,.0f} cues/s)"
+        )
+
+        start = time.perf_counter()
+        save_sentence_json(
+            srt_path,
+            os.path.join(tmp_dir, "sentence.json"),
+            os.path.join(tmp_dir, "word.json"),
+            output_format,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"convert to {output_format}: {elapsed:.2f} s ({num_cues / elapsed:,.0f} cues/s)")
+
+        if check:
+            try:
+                import pysrt  # noqa: F401
+            except ImportError:
+                print("pysrt is not installed, skipping the comparison")
+                return
+            start = time.perf_counter()
+            reference = _pysrt_words(srt_path)
+            elapsed = time.perf_counter() - start
+            assert reference == list(iter_words(srt_path)), "parser differs from pysrt"
+            print(f"pysrt: {num_cues} cues in {elapsed:.2f} s, results match")
 
 
 if __name__ == "__main__":
@@ -107,15 +310,38 @@ if __name__ == "__main__":
     parser.add_argument("--srt_word_input", type=str, default="mixdagZ-fwI_core.srt")
     parser.add_argument("--json_sentence_output", type=str, default="mixdagZ-fwI_core_sentence.json")
     parser.add_argument("--json_word_output", type=str, default="mixdagZ-fwI_core_word.json")
+    parser.add_argument("--output_format", type=str, default="json", choices=OUTPUT_FORMATS)
+    parser.add_argument("--max_sentence_seconds", type=float, default=None)
+    parser.add_argument(
+        "--silence_gap_seconds", type=float, default=None, help="end a sentence at a pause this long"
+    )
+    parser.add_argument(
+        "--benchmark", type=int, default=0, help="benchmark on a synthetic SRT file with this many cues"
+    )
+    parser.add_argument("--check", action="store_true", help="compare with pysrt in the benchmark")
     args = parser.parse_args()
 
-    # Get the directory of the current script
-    # current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(os.path.dirname(__file__), "data", "videos_study", VIDEO_ID)
+    if args.benchmark:
+        _benchmark(args.benchmark, args.output_format, args.check)
+    else:
+        # Get the directory of the current script
+        # current_dir = os.path.dirname(os.path.abspath(__file__))
+        data_dir = os.path.join(os.path.dirname(__file__), "data", "videos_study", VIDEO_ID)
 
-    # Construct full paths using os.path.join
-    srt_word_input = os.path.join(data_dir, args.srt_word_input)
-    json_sentence_output = os.path.join(data_dir, args.json_sentence_output)
-    json_word_output = os.path.join(data_dir, args.json_word_output)
+        # Construct full paths using os.path.join
+        srt_word_input = os.path.join(data_dir, args.srt_word_input)
+        json_sentence_output = os.path.join(data_dir, args.json_sentence_output)
+        json_word_output = os.path.join(data_dir, args.json_word_output)
 
-    save_sentence_json(srt_word_input, json_sentence_output, json_word_output)
\ No newline at end of file
+        save_sentence_json(
+            srt_word_input,
+            json_sentence_output,
+            json_word_output,
+            args.output_format,
+            max_sentence_ms=(
+                round(args.max_sentence_seconds * 1000) if args.max_sentence_seconds else None
+            ),
+            silence_gap_ms=(
+                round(args.silence_gap_seconds * 1000) if args.silence_gap_seconds else None
+            ),
+        )
@@ -0,0 +1,165 @@
+"""
+Stub Model Server
+
+A local HTTP server that answers POSTs like a chat completion endpoint, with
+injected latency and rate-limit errors, for exercising model_client.py (or
+the whole parser, with video_parser.OPENAI_BASE_URL pointed at it) without
+calling the real APIs. Requests are answered after `latency` seconds (+-50%);
+beyond `capacity` concurrent requests, and at random with
+`rate_limit_probability`, the server answers 429 with a Retry-After header.
+A request with a JSON schema response_format gets a JSON answer following the
+schema, every string "stub response".
+
+Usage:
+    server = start_stub_server(latency=0.2, capacity=8)
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    ...
+    server.shutdown()
+
+Run this file to drive concurrent requests through a ModelClient and see how
+the concurrency limit settles:
+    python stub_model_server.py [--requests=<n>] [--server_capacity=<n>] [--rate_limit_probability=<p>]
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_client import ModelClient
+
+
+# a value following a (structured output) JSON schema
+def _stub_value(schema):
+    if schema.get("type") == "object":
+        return {key: _stub_value(value) for key, value in schema.get("properties", {}).items()}
+    if schema.get("type") == "array":
+        return [_stub_value(schema.get("items", {}))]
+    if schema.get("type") in ("number", "integer"):
+        return 0
+    if schema.get("type") == "boolean":
+        return False
+    return "stub response"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        request = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request_bytes = len(request)
+        try:
+            response_format = json.loads(request).get("response_format") or {}
+        except (ValueError, AttributeError):
+            response_format = {}
+        content = "stub response"
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(_stub_value(response_format["json_schema"]["schema"]))
+        with server.lock:
+            server.in_flight += 1
+            overloaded = server.in_flight > server.capacity
+        try:
+            if overloaded or random.random() < server.rate_limit_probability:
+                self.send_response(429)
+                self.send_header("Retry-After", "0.2" if overloaded else "0.5")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+            body = json.dumps(
+                {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "stub",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    # roughly 4 bytes per token
+                    "usage": {
+                        "prompt_tokens": request_bytes // 4,
+                        "completion_tokens": 2,
+                        "total_tokens": request_bytes // 4 + 2,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+# start a server on a free local port, serving in a daemon thread
+def start_stub_server(latency=0.2, capacity=8, rate_limit_probability=0.05):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.capacity = capacity
+    server.rate_limit_probability = rate_limit_probability
+    server.in_flight = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _post_json(url, payload, timeout=30):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32, help="callers, like --max_workers")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--server_capacity", type=int, default=8)
+    parser.add_argument("--rate_limit_probability", type=float, default=0.05)
+    parser.add_argument("--requests_per_second", type=float, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = start_stub_server(args.latency, args.server_capacity, args.rate_limit_probability)
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    client = ModelClient(
+        "stub",
+        requests_per_second=args.requests_per_second,
+        max_concurrency=args.threads,
+        base_delay=0.1,
+        max_delay=2.0,
+        max_retries=10,
+    )
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        futures = [
+            executor.submit(client.call, _post_json, url, {"request": i}) for i in range(args.requests)
+        ]
+        failed = sum(1 for future in futures if future.exception() is not None)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    stats = client.stats()
+    print(
+        f"{args.requests - failed}/{args.requests} requests succeeded in {elapsed:.1f} s "
+        f"({(args.requests - failed) / elapsed:.1f} req/s, ideal {args.server_capacity / args.latency:.1f})"
+    )
+    print(
+        f"{stats['retries']} retries, {stats['rate_limited']} rate limited, "
+        f"concurrency limit settled at {stats['concurrency_limit']} (server capacity {args.server_capacity})"
+    )
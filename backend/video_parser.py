@@ -15,13 +15,25 @@ Dependencies:
 - OpenAI API for image analysis
 - GAMA model via Gradio for audio analysis
 - FFmpeg for audio extraction
-- SceneDetect for video scene detection
-- OpenCV for image processing
+- OpenCV for video decoding, scene detection (SceneDetect's content detector
+  algorithm, see scene_detection.py) and image processing
+- NumPy for audio clipping
 
 Usage:
 Place the video file and its annotation files in the appropriate directory
 Run the script to process the video
-The resulting knowledge base will be saved as a JSON file
+    python video_parser.py [--video_id=<id>] [--max_workers=<n>] [--fresh] [--sound]
+Use --max_workers to run several model calls concurrently (they are network bound)
+and --sound to describe the environment sound of every sentence
+Finished sentences are checkpointed to parser_res/, an interrupted run resumes from there
+unless --fresh is given (sentences changed since the checkpoint are parsed again)
+The resulting knowledge base will be saved as a JSON file, and as JSON Lines with a
+time index for reading single segments (see knowledge_store.py) and a search index
+for finding the segments relevant to a question (see knowledge_search.py)
+To parse many videos, see batch_parser.py
+From Python:
+    from video_parser import VideoPipeline
+    VideoPipeline("mixdagZ-fwI_core", max_workers=8).run()
 
 Output format includes:
 - Video transcript segments
@@ -31,22 +43,36 @@ Output format includes:
 - Environmental sound descriptions
 """
 
+import argparse
+import hashlib
 import json
-import shutil
-import cv2
-import base64
+import logging
 import os
-from openai import OpenAI
-from gradio_client import Client, handle_file
-from tqdm import tqdm
-from scenedetect import VideoManager, SceneManager
-from scenedetect.detectors import ContentDetector
-from scenedetect.scene_manager import save_images
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import lru_cache
+
+from frame_index import KeyFrame, KeyFrameIndex
+from frame_store import KeyFrameStore
+from interval_join import best_overlap
+from knowledge_store import write_knowledge
+from model_client import ModelClient
+import run_metrics
+from run_metrics import RunMetrics
+from response_cache import ResponseCache
+from sound_windows import SoundWindowScheduler, sound_clip_window
+
+# OpenCV, NumPy, OpenAI, Gradio and tqdm are imported where they are first used,
+# so importing this module is fast and does no I/O
 
 
+logger = logging.getLogger("video_parser")
+
 ######## Global variables ########
 # Result format
-video_knowledge_output = []
 info_piece = {
     "index": int,
     "segment": [int, int],
@@ -60,24 +86,215 @@ info_piece = {
     "step_description": str,      # describe the step being performed in the video clip
     "food_and_kitchenware_description": str, # describe the food and kitchenware objects in the video clip
     "environment_sound_description": str, # describe the environment sound
+    # "environment_sound_screen": dict,   # audio pre-screen label and features (with --sound)
 }
 
-print("--> Initializing...")
-VIDEO_ID = "mixdagZ-fwI_core"
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "videos_study", VIDEO_ID)
-procedure_annotation = json.load(
-    open(os.path.join(DATA_DIR, f"{VIDEO_ID}_procedure.json"))
-)["annotations"]
-transcript_sentence = json.load(
-    open(os.path.join(DATA_DIR, f"{VIDEO_ID}_sentence.json"))
+REQUIRED_KEY = [
+    "index",
+    "segment",
+    "video_transcript",
+    "procedure_description",
+    "step_description",              # describe the step being performed in the video clip
+    "food_and_kitchenware_description",    # describe the food and kitchenware objects in the video clip
+    "environment_sound_description"        # describe the environment sound
+]
+
+# Every video lives in VIDEOS_DIR/{VIDEO_ID}/ with {VIDEO_ID}.mp4, {VIDEO_ID}_procedure.json
+# and {VIDEO_ID}_sentence.json
+VIDEOS_DIR = os.path.join(os.path.dirname(__file__), "data", "videos_study")
+DEFAULT_VIDEO_ID = "mixdagZ-fwI_core"
+SECRET_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "cooking-react-next", "secret.json"
 )
-video_path = os.path.join(DATA_DIR, f"{VIDEO_ID}.mp4")
-frame_output_dir = os.path.join(DATA_DIR, "key_frames")
-audio_output_dir = os.path.join(DATA_DIR, "audio_output")
-res_output_dir = os.path.join(DATA_DIR, "parser_res")
+# Key frames are kept base64-encoded in memory (LRU, bounded by this budget);
+# set SAVE_KEY_FRAMES to also write them to key_frames/
+SAVE_KEY_FRAMES = False
+KEY_FRAME_STORE_MAX_BYTES = 512 * 1024 * 1024
+# Scene detection: detect on frames downscaled by this factor (None: to ~256 px wide,
+# like SceneDetect), feed only every (SCENE_DETECT_FRAME_SKIP + 1)-th frame, split
+# long videos across this many processes
+SCENE_DETECT_THRESHOLD = 10
+SCENE_DETECT_DOWNSCALE = None
+SCENE_DETECT_FRAME_SKIP = 0
+SCENE_DETECT_WORKERS = os.cpu_count() or 1
+# Key frames whose perceptual hashes ("dhash" or "phash", see frame_hash.py) differ
+# in at most KEY_FRAME_DEDUP_DISTANCE of 64 bits share one representative frame;
+# None keeps every key frame
+KEY_FRAME_DEDUP = "dhash"
+KEY_FRAME_DEDUP_DISTANCE = 5
+# Sentences overlapping fewer than MIN_FRAMES_PER_SENTENCE key frames (e.g. inside
+# a long continuous shot) get SENTENCE_SAMPLE_POINTS frames sampled at their start,
+# middle and end, all extracted in one forward pass (see frame_sampler.py); 0 disables
+MIN_FRAMES_PER_SENTENCE = 2
+SENTENCE_SAMPLE_POINTS = 3
+# Image preparation before upload: longer edge capped at IMAGE_MAX_EDGE pixels
+# (None keeps the original size), re-encoded as IMAGE_FORMAT ("jpeg" or "webp"),
+# and at most MAX_FRAMES_PER_REQUEST frames per GPT request, sampled "uniform"ly
+# over time or as the most "distinct" ones
+IMAGE_MAX_EDGE = 768
+IMAGE_FORMAT = "jpeg"
+IMAGE_QUALITY = 80
+MAX_FRAMES_PER_REQUEST = 6
+FRAME_SAMPLING = "distinct"
+GPT_MODEL = "gpt-4o-mini"
+GPT_MAX_TOKENS = 100
+GAMA_MODEL = "sonalkum/GAMA-IT"
+# None for the OpenAI API, or e.g. a local stub server (see model_client.py)
+OPENAI_BASE_URL = None
+# Every GPT / GAMA call goes through a shared ModelClient (see model_client.py):
+# rate limit, adaptive concurrency limit and retries with backoff, per service
+MODEL_CLIENT_SETTINGS = {
+    "gpt": {
+        "requests_per_second": 5,
+        "initial_concurrency": 4,
+        "max_concurrency": 32,
+        "latency_target": 30,
+        "max_retries": 6,
+    },
+    "gama": {
+        "requests_per_second": 1,
+        "initial_concurrency": 2,
+        "max_concurrency": 4,
+        "latency_target": None,
+        "max_retries": 4,
+    },
+}
+# HTTP connections kept open to the OpenAI API
+OPENAI_MAX_CONNECTIONS = 32
+# Content-addressed cache of GPT / GAMA responses, shared by all videos and runs
+USE_RESPONSE_CACHE = True
+RESPONSE_CACHE_DIR = os.path.join(os.path.dirname(__file__), "data", "response_cache")
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Label every sound window locally (silent / speech / environmental, see
+# audio_screen.py) and only send the environmental ones to GAMA; None for the
+# default thresholds
+AUDIO_PRESCREEN = True
+AUDIO_PRESCREEN_THRESHOLDS = None
+# Sound windows of neighbouring sentences are snapped onto a grid with this stride
+# (seconds) and each distinct window is described once; None describes every
+# sentence's own window
+SOUND_WINDOW_STRIDE = 5.0
+# Vision requests (see vision_requests.py): "separate" asks for every field of a
+# sentence in its own GPT call; "fused" for all fields of a sentence in one call
+# with a structured (JSON schema) response; "batched" also packs up to
+# VISION_BATCH_MAX_SEGMENTS consecutive sentences no longer than
+# VISION_BATCH_MAX_SEGMENT_SECONDS into one call, within VISION_BATCH_MAX_IMAGES
+# distinct frames and VISION_BATCH_MAX_TOKENS completion tokens. A response that
+# does not follow the schema falls back to separate calls for its sentences
+VISION_REQUEST_MODE = "batched"
+VISION_BATCH_MAX_SEGMENTS = 4
+VISION_BATCH_MAX_SEGMENT_SECONDS = 8
+VISION_BATCH_MAX_IMAGES = 12
+VISION_BATCH_MAX_TOKENS = 800
+
+STEP_PROMPT = "Analyze these consecutive screenshots from a cooking video and identify the specific cooking step being performed. \
+            Focus on the primary cooking action or technique being demonstrated \
+            Describe the cooking step with precise, action-oriented natural language. \
+            Consider all screenshots as representing a single continuous cooking step. \
+            e.g. 'The chef is sautéing diced vegetables in olive oil over medium heat while stirring continuously to ensure even cooking.' \
+            Provide your description directly without phrases like 'The video shows...' or 'In this clip...'"
+FOOD_AND_KITCHENWARE_PROMPT = "Analyze these consecutive screenshots from a cooking video and provide a description on \
+            the appearance, relative position and relationship of the following objects:  \
+            1. Ingredients: focusing on their state (raw, chopped, cooked, etc.), appearance, and approximate quantities. \
+            2. Kitchenware: Identify all tools, utensils, cookware, and appliances, describing how they're currently being used. \
+            e.g., 'diced onions in a metal bowl next to a chef's knife'\
+            Describe the food and kitchenware objects in precise natural language. \
+            \
+            Consider all screenshots as a continuous scene rather than explaining each screenshot separately. \
+            Start directly with your description without any introductory phrases like 'The video shows...' or 'I can see...'"
+SOUND_QUESTION = "Describe the audio precisely.\
+            You should focus on the non-speech part of the audio. \
+            Go straight to the description without any introductory words such as: \
+            'Audio caption:...', 'Audio description:...', etc."
+# the vision fields and their prompts, in output order
+VISION_PROMPTS = {
+    "step_description": STEP_PROMPT,
+    "food_and_kitchenware_description": FOOD_AND_KITCHENWARE_PROMPT,
+}
+
+
+#####################################
+######## Shared clients #############
+#####################################
+# The clients are created on first use and shared by all videos parsed in this process
+_client_lock = threading.Lock()
+_openai_client = None
+_gama_client = None
+_model_clients = {}
+_response_cache = None
+
 
-# Create directories if they don't exist, and clean up existing content
-for directory in [frame_output_dir, audio_output_dir, res_output_dir]:
+# read secret.json
+@lru_cache(maxsize=None)
+def load_secrets():
+    with open(SECRET_PATH, "r") as f:
+        secret = json.load(f)
+    return secret["OPENAI_KEY"], secret.get("HF_TOKEN")
+
+
+# one OpenAI client, so its HTTP connections are pooled and reused across calls;
+# retries are done by the ModelClient, not by the SDK
+def get_openai_client():
+    global _openai_client
+    with _client_lock:
+        if _openai_client is None:
+            import httpx
+            from openai import OpenAI
+
+            openai_api_key, _ = load_secrets()
+            _openai_client = OpenAI(
+                api_key=openai_api_key,
+                base_url=OPENAI_BASE_URL,
+                max_retries=0,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                    ),
+                    timeout=httpx.Timeout(120, connect=10),
+                ),
+            )
+        return _openai_client
+
+
+def get_gama_client():
+    global _gama_client
+    with _client_lock:
+        if _gama_client is None:
+            from gradio_client import Client
+
+            # _gama_client = Client("sonalkum/GAMA")
+            _gama_client = Client(GAMA_MODEL)
+            # _gama_client = Client.duplicate("sonalkum/GAMA", hardware='a10g-small', hf_token=HF_TOKEN)
+        return _gama_client
+
+
+# the resilience wrapper of a service ("gpt" or "gama")
+def get_model_client(service):
+    with _client_lock:
+        if service not in _model_clients:
+            _model_clients[service] = ModelClient(service, **MODEL_CLIENT_SETTINGS[service])
+        return _model_clients[service]
+
+
+# Model responses are cached across runs, outside the per-video directories
+def get_response_cache():
+    global _response_cache
+    if not USE_RESPONSE_CACHE:
+        return None
+    with _client_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                RESPONSE_CACHE_DIR, max_bytes=RESPONSE_CACHE_MAX_BYTES
+            )
+        return _response_cache
+
+
+#####################################
+######## Bootstrap functions ########
+#####################################
+# Create the directory if it doesn't exist, and clean up existing content
+def clean_directory(directory):
     if os.path.exists(directory):
         for file in os.listdir(directory):
             file_path = os.path.join(directory, file)
@@ -88,99 +305,135 @@ for directory in [frame_output_dir, audio_output_dir, res_output_dir]:
     else:
         os.makedirs(directory)
 
-# Initialize video manager
-video_manager = VideoManager([video_path])
-scene_manager = SceneManager()
-scene_manager.add_detector(ContentDetector(threshold=10))
-
-try:
-    # Start the video manager and run scene detection
-    video_manager.start()
-    scene_manager.detect_scenes(frame_source=video_manager)
-
-    # Get the list of detected scenes
-    scene_list = scene_manager.get_scene_list()
-    print(f"Detected {len(scene_list)} scenes.")
-
-    # Save images for each scene with timestamps in filename
-    for i, scene in enumerate(scene_list):
-        start_time = int(scene[0].get_seconds() * 1000)  # Convert to milliseconds
-        end_time = int(scene[1].get_seconds() * 1000)
-        filename = f"{VIDEO_ID}_scene_{start_time}_{end_time}"
-        save_images(
-            scene_list=[scene],
-            video=video_manager,
-            num_images=1,
-            output_dir=frame_output_dir,
-            image_name_template=filename,
-        )
-finally:
-    # Release the video manager resources
-    video_manager.release()
 
-# read secret.json
-with open(
-    os.path.join(os.path.dirname(__file__), "..", "cooking-react-next", "secret.json"),
-    "r",
-) as f:
-    secret = json.load(f)
-    OPENAI_API_KEY = secret["OPENAI_KEY"]
-    HF_TOKEN = secret["HF_TOKEN"]
+# Make GPT call
+def analyze_images_with_gpt4(image_base64_list, prompt):
+    content = [{"type": "text", "text": prompt}] + [
+        _image_part(image_base64) for image_base64 in image_base64_list
+    ]
+    return _call_gpt4(content, image_base64_list, GPT_MAX_TOKENS)
 
 
-# gamaClient = Client("sonalkum/GAMA")
-gamaClient = Client("sonalkum/GAMA-IT")
-# gamaClient = Client.duplicate("sonalkum/GAMA", hardware='a10g-small', hf_token=HF_TOKEN)
-print("Done.")
+# Ask for the vision `fields` of several segments (each a list of base64 frames) in
+# one call with a structured response; every distinct frame is sent once. Returns
+# one dict of fields per segment, raises ValueError if the response is unusable
+def analyze_segments_with_gpt4(segment_images, fields):
+    from vision_requests import fused_prompt, number_images, parse_fused_response, response_schema
 
+    images, image_numbers = number_images(segment_images)
+    prompt = fused_prompt({field: VISION_PROMPTS[field] for field in fields}, image_numbers)
+    content = [{"type": "text", "text": prompt}]
+    for number, image_base64 in enumerate(images, 1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append(_image_part(image_base64))
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "segment_descriptions",
+            "strict": True,
+            "schema": response_schema(fields, len(segment_images)),
+        },
+    }
+    answer = _call_gpt4(
+        content,
+        images,
+        GPT_MAX_TOKENS * len(fields) * len(segment_images) + 50,
+        segments=len(segment_images),
+        response_format=response_format,
+    )
+    return parse_fused_response(answer, fields, len(segment_images))
 
-#####################################
-######## Bootstrap functions ########
-#####################################
-# Make GPT call
-def analyze_images_with_gpt4(image_base64_list, prompt):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-            ]
-            + [
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{image_base64}"},
-                }
-                for image_base64 in image_base64_list
-            ],
-        }
-    ]
-    response = client.chat.completions.create(
-        model="gpt-4o-mini", messages=messages, max_tokens=100
+
+def _image_part(image_base64):
+    from image_payload import MIME_TYPES
+
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:{MIME_TYPES[IMAGE_FORMAT]};base64,{image_base64}"},
+    }
+
+
+# One chat completion through the shared GPT model client, recorded as a gpt_call
+# stage; returns the text of the answer
+def _call_gpt4(content, image_base64_list, max_tokens, segments=1, **kwargs):
+    image_bytes = sum(len(image_base64) for image_base64 in image_base64_list)
+    logger.info(
+        "GPT request: %d images, %d image bytes (base64), %d prompt chars, %d segments",
+        len(image_base64_list),
+        image_bytes,
+        sum(len(part["text"]) for part in content if part["type"] == "text"),
+        segments,
     )
+    model_client = get_model_client("gpt")
+    with run_metrics.current().stage("gpt_call") as counters:
+        response = model_client.call(
+            get_openai_client().chat.completions.create,
+            model=GPT_MODEL,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+        counters["images"] += len(image_base64_list)
+        counters["image_bytes"] += image_bytes
+        counters["segments"] += segments
+        counters["retries"] += model_client.last_retries
+        if response.usage is not None:
+            counters["prompt_tokens"] += response.usage.prompt_tokens
+            counters["completion_tokens"] += response.usage.completion_tokens
     # Return the response
     return response.choices[0].message.content
 
 
-# Given the start and end time of a video, locate the corresponding procedure annotation
-def locate_procedure_annotation(startTime, endTime):
-    for annotation in procedure_annotation:
-        if (
-            (
-                annotation["segment"][0] <= float(startTime) / 1000
-                and annotation["segment"][1] >= float(endTime) / 1000
-            )
-            or (
-                annotation["segment"][0] >= float(startTime) / 1000
-                and annotation["segment"][0] <= float(endTime) / 1000
-            )
-            or (
-                annotation["segment"][1] >= float(endTime) / 1000
-                and annotation["segment"][1] <= float(startTime) / 1000
-            )
-        ):
-            return annotation["sentence"]
-    return ""
+# Make GAMA call
+def describe_audio_with_gama(audio_clip_path):
+    from gradio_client import handle_file
+
+    _, audio_description = get_gama_client().predict(
+        audio_path=handle_file(audio_clip_path),
+        question=SOUND_QUESTION,
+        api_name="/predict",
+    )
+    return audio_description
+
+
+# Make GPT call, reusing the cached response if the same images were sent with the same prompt before
+def analyze_images_with_gpt4_cached(image_base64_list, prompt):
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return analyze_images_with_gpt4(image_base64_list, prompt)
+    key = response_cache.make_key(
+        f"{GPT_MODEL}:max_tokens={GPT_MAX_TOKENS}", prompt, *image_base64_list
+    )
+    return response_cache.get_or_call(
+        key,
+        lambda: analyze_images_with_gpt4(image_base64_list, prompt),
+        on_hit=record_cache_hit("gpt_cache_hit"),
+    )
+
+
+# Fused GPT call, reusing the cached answers if the same segments were asked for before;
+# unusable responses are not cached
+def analyze_segments_with_gpt4_cached(segment_images, fields):
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return analyze_segments_with_gpt4(segment_images, fields)
+    key = response_cache.make_key(
+        f"{GPT_MODEL}:fused:max_tokens={GPT_MAX_TOKENS}",
+        json.dumps({field: VISION_PROMPTS[field] for field in fields}),
+        # the segment boundaries, then the frames
+        json.dumps([len(images) for images in segment_images]),
+        *(image for images in segment_images for image in images),
+    )
+    return response_cache.get_or_call(
+        key,
+        lambda: analyze_segments_with_gpt4(segment_images, fields),
+        on_hit=record_cache_hit("gpt_cache_hit"),
+    )
+
+
+# on_hit callback for ResponseCache.get_or_call, recording hits in the run metrics as `stage`
+def record_cache_hit(stage):
+    return lambda seconds: run_metrics.current().add(stage, seconds, cache_hits=1)
 
 
 # determine the action type
@@ -193,212 +446,850 @@ def determine_action_description(startTime, endTime):
     return "PALCE_HOLDER_ACTION_DESCRIPTION"
 
 
-# get video clip description
-def get_step_description(startTime, endTime):
-    frames = []
-    for file in os.listdir(frame_output_dir):
-        if file.startswith(f"{VIDEO_ID}_scene_") and len(file.split("_")) >= 4:
-            file_start = int(file.split("_")[-2])
-            file_end = int(file.split("_")[-1].split(".")[0])
-            if (
-                (file_start >= int(startTime) and file_end <= int(endTime))
-                or (file_end >= int(startTime) and file_start <= int(startTime))
-                or (file_end >= int(endTime) and file_start <= int(endTime))
-            ):
-                with open(os.path.join(frame_output_dir, file), "rb") as image_file:
-                    frames.append(base64.b64encode(image_file.read()).decode("utf-8"))
-    prompt = "Analyze these consecutive screenshots from a cooking video and identify the specific cooking step being performed. \
-            Focus on the primary cooking action or technique being demonstrated \
-            Describe the cooking step with precise, action-oriented natural language. \
-            Consider all screenshots as representing a single continuous cooking step. \
-            e.g. 'The chef is sautéing diced vegetables in olive oil over medium heat while stirring continuously to ensure even cooking.' \
-            Provide your description directly without phrases like 'The video shows...' or 'In this clip...'"
-    step_desp = analyze_images_with_gpt4(frames, prompt)
-    return step_desp
-
-
-# get food and kitchenware description
-def get_food_and_kitchenware_description(startTime, endTime):
-    frames = []
-    for file in os.listdir(frame_output_dir):
-        if file.startswith(f"{VIDEO_ID}_scene_") and len(file.split("_")) >= 4:
-            file_start = int(file.split("_")[-2])
-            file_end = int(file.split("_")[-1].split(".")[0])
-            if (
-                (file_start >= int(startTime) and file_end <= int(endTime))
-                or (file_end >= int(startTime) and file_start <= int(startTime))
-                or (file_end >= int(endTime) and file_start <= int(endTime))
-            ):
-                with open(os.path.join(frame_output_dir, file), "rb") as image_file:
-                    frames.append(base64.b64encode(image_file.read()).decode("utf-8"))
-    prompt = "Analyze these consecutive screenshots from a cooking video and provide a description on \
-            the appearance, relative position and relationship of the following objects:  \
-            1. Ingredients: focusing on their state (raw, chopped, cooked, etc.), appearance, and approximate quantities. \
-            2. Kitchenware: Identify all tools, utensils, cookware, and appliances, describing how they're currently being used. \
-            e.g., 'diced onions in a metal bowl next to a chef's knife'\
-            Describe the food and kitchenware objects in precise natural language. \
-            \
-            Consider all screenshots as a continuous scene rather than explaining each screenshot separately. \
-            Start directly with your description without any introductory phrases like 'The video shows...' or 'I can see...'"
-    food_and_kitchenware_desp = analyze_images_with_gpt4(frames, prompt)
-    return food_and_kitchenware_desp
-
-
-# get visual scene base64
-def get_visual_scene_base64(startTime, endTime):
-    frames = []
-    for file in os.listdir(frame_output_dir):
-        if file.startswith(f"{VIDEO_ID}_scene_") and len(file.split("_")) >= 4:
-            file_start = int(file.split("_")[-2])
-            file_end = int(file.split("_")[-1].split(".")[0])
-            if (
-                (file_start >= int(startTime) and file_end <= int(endTime))
-                or (file_end >= int(startTime) and file_start <= int(startTime))
-                or (file_end >= int(endTime) and file_start <= int(endTime))
-            ):
-                with open(os.path.join(frame_output_dir, file), "rb") as image_file:
-                    frames.append(base64.b64encode(image_file.read()).decode("utf-8"))
-    return frames
-
-
-# get visual scene path
-def get_visual_scene_path(startTime, endTime):
-    paths = []
-    for file in os.listdir(frame_output_dir):
-        if file.startswith(f"{VIDEO_ID}_scene_") and len(file.split("_")) >= 4:
-            file_start = int(file.split("_")[-2])
-            file_end = int(file.split("_")[-1].split(".")[0])
-            if (
-                (file_start >= int(startTime) and file_end <= int(endTime))
-                or (file_end >= int(startTime) and file_start <= int(startTime))
-                or (file_end >= int(endTime) and file_start <= int(endTime))
-            ):
-                paths.append(os.path.join(frame_output_dir, file))
-    return paths
-
-
 # get object list
 def get_object_list(startTime, endTime):
     return ["OBJ1", "OBJ2", "OBJ3"]
 
 
-# @TODO: determine the sound type
-def get_environment_sound_description(startTime, endTime, original_audio_path):
-    transcript_start_seconds = float(startTime) / 1000
-    transcript_end_seconds = float(endTime) / 1000
-    # if length is less than 10 seconds, increase the start and end time to 10 seconds in total
-    # Make clip exactly 10 seconds by extending equally on both sides
-    if transcript_end_seconds - transcript_start_seconds < 10:
-        time_to_add = (10 - (transcript_end_seconds - transcript_start_seconds)) / 2
-        audio_clip_start_seconds = transcript_start_seconds - time_to_add
-        audio_clip_end_seconds = transcript_end_seconds + time_to_add
-    else:
-        audio_clip_start_seconds = transcript_start_seconds
-        audio_clip_end_seconds = transcript_end_seconds
-    audio_clip_path = os.path.join(
-        audio_output_dir,
-        f"{VIDEO_ID}_clip_{transcript_start_seconds}_{transcript_end_seconds}.wav",
-    )
-    os.system(
-        f"ffmpeg -i {original_audio_path} -ss {max(0, audio_clip_start_seconds):.3f} -to {audio_clip_end_seconds:.3f} -c copy {audio_clip_path} -loglevel quiet"
+# Fingerprint of everything a sentence's piece is built from besides the model
+# answers. A checkpoint record is only reused while its fingerprint still matches,
+# so regenerating {VIDEO_ID}_sentence.json (e.g. with other sentence boundaries)
+# does not mix old pieces into the new output.
+def sentence_fingerprint(sentenceInfo, segment_start_time, procedure_description):
+    key = json.dumps(
+        [
+            sentenceInfo["sentenceIndex"],
+            sentenceInfo["text"],
+            sentenceInfo["startTime"],
+            sentenceInfo["endTime"],
+            segment_start_time,
+            procedure_description,
+        ],
+        ensure_ascii=False,
     )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-    _, audio_description = gamaClient.predict(
-        audio_path=handle_file(audio_clip_path),
-        question="Describe the audio precisely.\
-            You should focus on the non-speech part of the audio. \
-            Go straight to the description without any introductory words such as: \
-            'Audio caption:...', 'Audio description:...', etc.",
-        api_name="/predict",
-    )
-    # save audio_description to a txt file
-    # with open(os.path.join(audio_output_dir, "audio_description.txt"), "a") as f:
-    #     f.write(
-    #         f"Time {transcript_start_seconds:.1f}-{transcript_end_seconds:.1f}s: {audio_description}\n"
-    #     )
-    return audio_description
+
+# Read the finished pieces of a previous run from the JSON Lines checkpoint, keyed
+# by sentence index. Each record is {"sentence": fingerprint, "piece": piece};
+# records whose fingerprint differs from `fingerprints` ({sentence index:
+# fingerprint}) are stale and skipped. A truncated last line (crash while writing)
+# is ignored. Returns the pieces and the number of stale records.
+def load_checkpoint(checkpoint_path, fingerprints):
+    finished = {}
+    stale = 0
+    if not os.path.exists(checkpoint_path):
+        return finished, stale
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            piece = record.get("piece")
+            if piece is None or fingerprints.get(piece.get("index")) != record.get("sentence"):
+                stale += 1
+                continue
+            finished[piece["index"]] = piece
+    return finished, stale
 
 
 #####################################
-######## Main function ##############
+######## Pipeline ###################
 #####################################
-if __name__ == "__main__":
-    REQUIRED_KEY = [
-        "index",
-        "segment",
-        "video_transcript",
-        "procedure_description",
-        "step_description",              # describe the step being performed in the video clip
-        "food_and_kitchenware_description",    # describe the food and kitchenware objects in the video clip
-        "environment_sound_description"        # describe the environment sound
-    ]
-    
-    print("\n--> Getting audio track...")
-    # extract audio track from the video
-    original_audio_path = os.path.join(audio_output_dir, f"{VIDEO_ID}_original.wav")
-    os.system(
-        f"ffmpeg -i {video_path} -q:a 0 -map a {original_audio_path} -loglevel quiet"
-    )
-    print("Done.")
-
-    # Fill video knowledge output
-    print("\n--> Parsing video...")
-    last_end_time = 0
-
-    # sample a few sentences for testing
-    # transcript_sentence = transcript_sentence[:3]
-    total_sentences = len(transcript_sentence)
-    for sentenceInfo in tqdm(
-        transcript_sentence,
-        total=total_sentences,
-        desc="Parsing video",
-        unit="sentence",
+# Knowledge extraction for one video, as explicit stages:
+#   detect_scenes   key frames into the in-memory store and the time index (CPU bound)
+#   extract_audio   decode the audio track once with ffmpeg
+#   describe_vision step / food and kitchenware descriptions of one sentence, or of a
+#                   run of short sentences in one request (GPT, see vision_requests.py)
+#   describe_sound_window environment sound description of one sound window,
+#                   shared by the sentences centered in it (GAMA, see sound_windows.py)
+#   assemble        build the knowledge piece of one sentence
+# run() overlaps the stages: scene detection and audio extraction run at the same
+# time, and the per-sentence model calls of one stage start as soon as that stage's
+# input is ready. Constructing a pipeline does no I/O.
+class VideoPipeline:
+    def __init__(
+        self,
+        video_id=DEFAULT_VIDEO_ID,
+        videos_dir=None,
+        max_workers=1,
+        fresh=False,
+        describe_sound=False,
+        scene_workers=None,
+        scene_detection_lock=None,
     ):
+        self.video_id = video_id
+        self.data_dir = os.path.join(videos_dir or VIDEOS_DIR, video_id)
+        self.video_path = os.path.join(self.data_dir, f"{video_id}.mp4")
+        self.frame_output_dir = os.path.join(self.data_dir, "key_frames")
+        self.audio_output_dir = os.path.join(self.data_dir, "audio_output")
+        self.res_output_dir = os.path.join(self.data_dir, "parser_res")
+        self.original_audio_path = os.path.join(
+            self.audio_output_dir, f"{video_id}_original.wav"
+        )
+        self.checkpoint_path = os.path.join(
+            self.res_output_dir, f"{video_id}_video_knowledge.checkpoint.jsonl"
+        )
+        self.output_path = os.path.join(
+            self.res_output_dir, f"{video_id}_video_knowledge.json"
+        )
+        self.indexed_output_path = os.path.join(
+            self.res_output_dir, f"{video_id}_video_knowledge.jsonl"
+        )
+        # number of sentences in flight (model calls are network bound)
+        self.max_workers = max_workers
+        self.fresh = fresh
+        self.describe_sound_enabled = describe_sound
+        self.scene_workers = scene_workers or SCENE_DETECT_WORKERS
+        # set by the batch driver to serialize the CPU-bound scene detection across videos
+        self.scene_detection_lock = scene_detection_lock
+
+        self.procedure_annotation = []
+        self.transcript_sentence = []
+        # sentenceIndex -> sentence_fingerprint() of the transcript being parsed
+        self.sentence_fingerprints = {}
+        self.key_frame_index = None
+        self.key_frame_store = None
+        self.key_frame_signatures = {}
+        # (startTime, endTime) -> frames sampled for the sentence, as KeyFrame
+        self.sentence_frames = {}
+        self.audio_track = None
+        self.audio_screen = None
+        self.audio_screen_results = []
+        self.sound_windows = SoundWindowScheduler(stride=SOUND_WINDOW_STRIDE)
+
+    def load_annotations(self):
+        with open(os.path.join(self.data_dir, f"{self.video_id}_procedure.json")) as f:
+            self.procedure_annotation = json.load(f)["annotations"]
+        with open(os.path.join(self.data_dir, f"{self.video_id}_sentence.json")) as f:
+            self.transcript_sentence = json.load(f)
+
+    # Key frames are regenerated by every run. Audio clips and parsing results are
+    # kept so that an interrupted run can resume; they are only cleaned for a fresh run.
+    def prepare_directories(self):
+        clean_directory(self.frame_output_dir)
+        if self.fresh:
+            clean_directory(self.audio_output_dir)
+            clean_directory(self.res_output_dir)
+        os.makedirs(self.audio_output_dir, exist_ok=True)
+        os.makedirs(self.res_output_dir, exist_ok=True)
+
+    ######## Stages ########
+    # Detect scenes and grab the middle frame of each scene in a single decode
+    # pass, straight into the key frame store, named with the scene timestamps
+    def detect_scenes(self, sentences=None):
+        from image_payload import compact_image, image_signature
+        from scene_detection import detect_key_frames
+
+        key_frame_index = KeyFrameIndex()
+        key_frame_store = KeyFrameStore(
+            max_bytes=KEY_FRAME_STORE_MAX_BYTES,
+            frame_dir=self.frame_output_dir if SAVE_KEY_FRAMES else None,
+        )
+        metrics = run_metrics.current()
+        with self.scene_detection_lock or nullcontext(), metrics.stage(
+            "scene_detection"
+        ) as counters:
+            key_frames = detect_key_frames(
+                self.video_path,
+                threshold=SCENE_DETECT_THRESHOLD,
+                downscale=SCENE_DETECT_DOWNSCALE,
+                frame_skip=SCENE_DETECT_FRAME_SKIP,
+                num_workers=self.scene_workers,
+            )
+            counters["scenes"] += len(key_frames)
+        print(f"Detected {len(key_frames)} scenes.")
+        groups = self.deduplicate_key_frames(key_frames)
+        key_frame_signatures = {}
+        with metrics.stage("frame_encoding") as counters:
+            for representative, members in groups.items():
+                start_time, end_time, image_bytes = key_frames[representative]
+                filename = f"{self.video_id}_scene_{start_time}_{end_time}.{IMAGE_FORMAT}"
+                # compact once here, every prompt then uploads the same small payload
+                _, image_bytes = compact_image(
+                    image_bytes,
+                    max_edge=IMAGE_MAX_EDGE,
+                    image_format=IMAGE_FORMAT,
+                    quality=IMAGE_QUALITY,
+                )
+                key_frame_store.put(filename, image_bytes, filename)
+                key_frame_signatures[filename] = image_signature(image_bytes)
+                # every scene of the group is looked up under the representative frame
+                for member in members:
+                    key_frame_index.add(key_frames[member][0], key_frames[member][1], filename)
+                counters["frames"] += 1
+                counters["encoded_bytes"] += len(image_bytes)
+        # sort once here, the index is read-only (and shared across threads) from now on
+        key_frame_index.build()
+        self.key_frame_store = key_frame_store
+        self.key_frame_signatures = key_frame_signatures
+        self.key_frame_index = key_frame_index
+        self.sample_sentence_frames(sentences)
+
+    # Sample frames for the sentences (default: all) with too few key frames, in one
+    # forward pass over the video; they are stored next to the key frames
+    def sample_sentence_frames(self, sentences=None):
+        from frame_sampler import FrameSampler, sentence_timestamps
+        from image_payload import compact_image, image_signature
+
+        if not MIN_FRAMES_PER_SENTENCE:
+            return
+        requests = {}
+        for sentenceInfo in sentences if sentences is not None else self.transcript_sentence:
+            startTime = int(float(sentenceInfo["startTime"]))
+            endTime = int(float(sentenceInfo["endTime"]))
+            key_frames = self.key_frame_index.query_distinct(startTime, endTime)
+            if len(key_frames) < MIN_FRAMES_PER_SENTENCE:
+                requests[(startTime, endTime)] = sentence_timestamps(
+                    startTime, endTime, SENTENCE_SAMPLE_POINTS
+                )
+        if not requests:
+            return
+        with run_metrics.current().stage("frame_sampling") as counters:
+            sampler = FrameSampler(self.video_path)
+            try:
+                samples = sampler.sample(
+                    [timestamp for timestamps in requests.values() for timestamp in timestamps]
+                )
+            finally:
+                sampler.close()
+            sentence_frames = {}
+            for (startTime, endTime), timestamps in requests.items():
+                frames = {}
+                for timestamp in timestamps:
+                    if timestamp not in samples:
+                        continue
+                    frame_ms, image_bytes = samples[timestamp]
+                    filename = f"{self.video_id}_frame_{frame_ms}.{IMAGE_FORMAT}"
+                    if filename not in self.key_frame_signatures:
+                        _, image_bytes = compact_image(
+                            image_bytes,
+                            max_edge=IMAGE_MAX_EDGE,
+                            image_format=IMAGE_FORMAT,
+                            quality=IMAGE_QUALITY,
+                        )
+                        self.key_frame_store.put(filename, image_bytes, filename)
+                        self.key_frame_signatures[filename] = image_signature(image_bytes)
+                        counters["frames"] += 1
+                        counters["encoded_bytes"] += len(image_bytes)
+                    frames[filename] = KeyFrame(frame_ms, frame_ms, filename)
+                sentence_frames[(startTime, endTime)] = list(frames.values())
+            counters["sentences"] += len(requests)
+            counters["frames_decoded"] += sampler.frames_decoded
+        print(
+            f"Sampled {int(counters['frames'])} frames for {len(requests)} sentences "
+            "with few key frames."
+        )
+        self.sentence_frames = sentence_frames
+
+    # the key frames overlapping a sentence and the frames sampled for it, in time order
+    def sentence_key_frames(self, startTime, endTime):
+        key_frames = self.key_frame_index.query_distinct(startTime, endTime)
+        sampled = self.sentence_frames.get((int(float(startTime)), int(float(endTime))))
+        if sampled:
+            key_frames = sorted(key_frames + sampled, key=lambda key_frame: key_frame.start)
+        return key_frames
+
+    # Group near-identical key frames (see frame_hash.py), returns {representative
+    # position: [positions of its scenes]}; the groups are saved to
+    # {VIDEO_ID}_key_frame_groups.json
+    def deduplicate_key_frames(self, key_frames):
+        from frame_hash import deduplicate_frames
+
+        if not KEY_FRAME_DEDUP:
+            return {position: [position] for position in range(len(key_frames))}
+        with run_metrics.current().stage("frame_dedup") as counters:
+            groups = deduplicate_frames(
+                [image_bytes for _, _, image_bytes in key_frames],
+                method=KEY_FRAME_DEDUP,
+                max_distance=KEY_FRAME_DEDUP_DISTANCE,
+            )
+            counters["duplicates"] += len(key_frames) - len(groups)
+            counters["duplicate_bytes"] += sum(
+                len(key_frames[member][2])
+                for members in groups.values()
+                for member in members[1:]
+            )
+        print(f"Key frames: {len(key_frames)} scenes -> {len(groups)} distinct frames.")
+        with open(
+            os.path.join(self.res_output_dir, f"{self.video_id}_key_frame_groups.json"), "w"
+        ) as f:
+            json.dump(
+                {
+                    "method": KEY_FRAME_DEDUP,
+                    "max_distance": KEY_FRAME_DEDUP_DISTANCE,
+                    "groups": [
+                        {
+                            "frame": list(key_frames[representative][:2]),
+                            "scenes": [list(key_frames[member][:2]) for member in members],
+                        }
+                        for representative, members in groups.items()
+                    ],
+                },
+                f,
+                indent=4,
+            )
+        return groups
+
+    # extract the audio track from the video, decoded once to 16 bit PCM;
+    # clips are sliced from this file in-process
+    def extract_audio(self):
+        self.decode_audio()
+        self.load_audio()
+
+    def decode_audio(self):
+        with run_metrics.current().stage("ffmpeg") as counters:
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-loglevel",
+                    "quiet",
+                    "-y",
+                    "-i",
+                    self.video_path,
+                    "-map",
+                    "a",
+                    "-acodec",
+                    "pcm_s16le",
+                    self.original_audio_path,
+                ],
+                check=True,
+            )
+            counters["wav_bytes"] += os.path.getsize(self.original_audio_path)
+
+    def load_audio(self):
+        from audio_track import AudioTrack
+
+        # memory-mapped once and shared across sentences
+        self.audio_track = AudioTrack(self.original_audio_path)
+        if AUDIO_PRESCREEN and self.describe_sound_enabled:
+            from audio_screen import AudioScreen
+
+            # features of the whole track in one pass, each window is then a cheap lookup
+            with run_metrics.current().stage("audio_analysis"):
+                self.audio_screen = AudioScreen(self.audio_track, AUDIO_PRESCREEN_THRESHOLDS)
+
+    # Describe the vision fields of consecutive sentences, in one fused request unless
+    # VISION_REQUEST_MODE is "separate"; returns one dict of fields per sentence
+    def describe_vision_batch(self, sentenceInfos):
+        fields = [field for field in VISION_PROMPTS if field in REQUIRED_KEY]
+        if VISION_REQUEST_MODE == "separate" or not fields:
+            return [self.describe_vision(sentenceInfo) for sentenceInfo in sentenceInfos]
+        segment_images = [
+            self.get_request_frames_base64(sentenceInfo["startTime"], sentenceInfo["endTime"])
+            for sentenceInfo in sentenceInfos
+        ]
+        try:
+            return analyze_segments_with_gpt4_cached(segment_images, fields)
+        except ValueError as error:
+            logger.warning(
+                "fused request for %d sentences failed (%s), asking separately",
+                len(sentenceInfos),
+                error,
+            )
+            run_metrics.current().add("vision_fallback", 0, sentences=len(sentenceInfos))
+            return [self.describe_vision(sentenceInfo) for sentenceInfo in sentenceInfos]
+
+    # Group the sentences (in time order) into vision requests, lists of positions
+    def plan_vision_requests(self, sentences):
+        from vision_requests import plan_batches
+
+        if VISION_REQUEST_MODE != "batched":
+            return [[position] for position in range(len(sentences))]
+        fields = [field for field in VISION_PROMPTS if field in REQUIRED_KEY]
+        segments = [
+            (
+                int(float(sentenceInfo["startTime"])),
+                int(float(sentenceInfo["endTime"])),
+                [
+                    key_frame.name
+                    for key_frame in self.select_request_frames(
+                        sentenceInfo["startTime"], sentenceInfo["endTime"]
+                    )
+                ],
+            )
+            for sentenceInfo in sentences
+        ]
+        return plan_batches(
+            segments,
+            max_segments=min(
+                VISION_BATCH_MAX_SEGMENTS,
+                max(1, VISION_BATCH_MAX_TOKENS // (GPT_MAX_TOKENS * max(1, len(fields)))),
+            ),
+            max_images=VISION_BATCH_MAX_IMAGES,
+            max_segment_ms=VISION_BATCH_MAX_SEGMENT_SECONDS * 1000,
+        )
+
+    def describe_vision(self, sentenceInfo):
         startTime = sentenceInfo["startTime"]
         endTime = sentenceInfo["endTime"]
-        sentenceIndex = sentenceInfo["sentenceIndex"]
-        text = sentenceInfo["text"]
-        _info_piece = {}
-        if "index" in REQUIRED_KEY:
-            _info_piece["index"] = sentenceIndex
-        if "segment" in REQUIRED_KEY:
-            _info_piece["segment"] = [last_end_time, endTime]
-        if "video_transcript" in REQUIRED_KEY:
-            _info_piece["video_transcript"] = text
-        if "procedure_description" in REQUIRED_KEY:
-            _info_piece["procedure_description"] = locate_procedure_annotation(
-                startTime, endTime
-            )
+        descriptions = {}
         if "step_description" in REQUIRED_KEY:
-            _info_piece["step_description"] = get_step_description(
+            descriptions["step_description"] = self.get_step_description(
                 startTime, endTime
             )
         if "food_and_kitchenware_description" in REQUIRED_KEY:
-            _info_piece["food_and_kitchenware_description"] = (
-                get_food_and_kitchenware_description(
-                    startTime, endTime
-                )
+            descriptions["food_and_kitchenware_description"] = (
+                self.get_food_and_kitchenware_description(startTime, endTime)
+            )
+        return descriptions
+
+    # Describe one sound window (in seconds), possibly shared by several sentences.
+    # GAMA is only asked about windows the pre-screen labels as environmental sound
+    def describe_sound_window(self, clip_start_seconds, clip_end_seconds):
+        descriptions = {}
+        if self.audio_screen is not None:
+            with run_metrics.current().stage("sound_screen"):
+                screen = self.audio_screen.screen(clip_start_seconds, clip_end_seconds)
+            self.audio_screen_results.append(
+                {"segment": [clip_start_seconds, clip_end_seconds], **screen}
             )
+            descriptions["environment_sound_screen"] = screen
+            if screen["label"] != "environmental":
+                descriptions["environment_sound_description"] = ""
+                return descriptions
+        descriptions["environment_sound_description"] = self.get_sound_clip_description(
+            clip_start_seconds, clip_end_seconds
+        )
+        return descriptions
+
+    # build the knowledge piece of a single transcript sentence
+    def assemble(
+        self,
+        sentenceInfo,
+        segment_start_time,
+        procedure_description,
+        vision_descriptions,
+        sound_descriptions,
+    ):
+        _info_piece = {}
+        if "index" in REQUIRED_KEY:
+            _info_piece["index"] = sentenceInfo["sentenceIndex"]
+        if "segment" in REQUIRED_KEY:
+            _info_piece["segment"] = [segment_start_time, sentenceInfo["endTime"]]
+        if "video_transcript" in REQUIRED_KEY:
+            _info_piece["video_transcript"] = sentenceInfo["text"]
+        if "procedure_description" in REQUIRED_KEY:
+            _info_piece["procedure_description"] = procedure_description
+        _info_piece.update(vision_descriptions)
         if "environment_sound_description" in REQUIRED_KEY:
-            # _info_piece["environment_sound_description"] = (
-            #     get_environment_sound_description(
-            #         startTime, endTime, original_audio_path
-            #     )
-            # )
-            _info_piece["environment_sound_description"] = ""
+            _info_piece["environment_sound_description"] = sound_descriptions.get(
+                "environment_sound_description", ""
+            )
+            if "environment_sound_screen" in sound_descriptions:
+                _info_piece["environment_sound_screen"] = sound_descriptions[
+                    "environment_sound_screen"
+                ]
         # if "object_list" in REQUIRED_KEY:
         #     _info_piece["object_list"] = get_object_list(startTime, endTime)
         # if "visual_scene_base64" in REQUIRED_KEY:
-        #     _info_piece["visual_scene_base64"] = get_visual_scene_base64(
+        #     _info_piece["visual_scene_base64"] = self.get_visual_scene_base64(
         #         startTime, endTime
         #     )
         # if "visual_scene_path" in REQUIRED_KEY:
-        #     _info_piece["visual_scene_path"] = get_visual_scene_path(startTime, endTime)
-        video_knowledge_output.append(_info_piece)
+        #     _info_piece["visual_scene_path"] = self.get_visual_scene_path(startTime, endTime)
+        return _info_piece
+
+    ######## Lookups and model calls ########
+    # Given the start and end times of all sentences, locate the corresponding procedure
+    # annotations (the one covering most of the sentence) in a single sweep over both lists
+    def locate_procedure_annotations(self, sentences):
+        matches = best_overlap(
+            [
+                (float(sentence["startTime"]) / 1000, float(sentence["endTime"]) / 1000)
+                for sentence in sentences
+            ],
+            [tuple(annotation["segment"]) for annotation in self.procedure_annotation],
+        )
+        return [
+            self.procedure_annotation[i]["sentence"] if i is not None else ""
+            for i in matches
+        ]
+
+    # Given the start and end time of a video, locate the corresponding procedure annotation
+    def locate_procedure_annotation(self, startTime, endTime):
+        return self.locate_procedure_annotations(
+            [{"startTime": startTime, "endTime": endTime}]
+        )[0]
+
+    # get video clip description
+    def get_step_description(self, startTime, endTime):
+        frames = self.get_request_frames_base64(startTime, endTime)
+        step_desp = analyze_images_with_gpt4_cached(frames, STEP_PROMPT)
+        return step_desp
+
+    # get food and kitchenware description
+    def get_food_and_kitchenware_description(self, startTime, endTime):
+        frames = self.get_request_frames_base64(startTime, endTime)
+        food_and_kitchenware_desp = analyze_images_with_gpt4_cached(
+            frames, FOOD_AND_KITCHENWARE_PROMPT
+        )
+        return food_and_kitchenware_desp
+
+    # get visual scene base64
+    def get_visual_scene_base64(self, startTime, endTime):
+        frames = []
+        for key_frame in self.sentence_key_frames(startTime, endTime):
+            frames.append(self.key_frame_store.get_base64(key_frame.name))
+        return frames
+
+    # the key frames sent to GPT for a sentence, at most MAX_FRAMES_PER_REQUEST of them
+    def select_request_frames(self, startTime, endTime):
+        from image_payload import sample_frames
+
+        key_frames = self.sentence_key_frames(startTime, endTime)
+        keep = sample_frames(
+            [self.key_frame_signatures[key_frame.name] for key_frame in key_frames],
+            MAX_FRAMES_PER_REQUEST,
+            method=FRAME_SAMPLING,
+        )
+        return [key_frames[i] for i in keep]
+
+    # get the frames sent to GPT for a sentence, base64-encoded
+    def get_request_frames_base64(self, startTime, endTime):
+        with run_metrics.current().stage("frame_lookup") as counters:
+            frames = [
+                self.key_frame_store.get_base64(key_frame.name)
+                for key_frame in self.select_request_frames(startTime, endTime)
+            ]
+            counters["frames"] += len(frames)
+        return frames
+
+    # get visual scene path
+    def get_visual_scene_path(self, startTime, endTime):
+        paths = []
+        for key_frame in self.sentence_key_frames(startTime, endTime):
+            path = self.key_frame_store.get_path(key_frame.name)
+            if path is not None:
+                paths.append(path)
+        return paths
+
+    # @TODO: determine the sound type
+    def get_environment_sound_description(self, startTime, endTime):
+        return self.get_sound_clip_description(*sound_clip_window(startTime, endTime))
+
+    # describe the audio between the two timestamps (in seconds) with GAMA
+    def get_sound_clip_description(self, audio_clip_start_seconds, audio_clip_end_seconds):
+        audio_clip_path = os.path.join(
+            self.audio_output_dir,
+            f"{self.video_id}_clip_{audio_clip_start_seconds}_{audio_clip_end_seconds}.wav",
+        )
+        # the clip is a slice of the memory-mapped original track, no ffmpeg process per sentence
+        audio_clip = self.audio_track.clip_bytes(
+            audio_clip_start_seconds, audio_clip_end_seconds
+        )
+
+        def describe_audio():
+            # the Gradio client uploads from a file path
+            with open(audio_clip_path, "wb") as audio_file:
+                audio_file.write(audio_clip)
+            model_client = get_model_client("gama")
+            with run_metrics.current().stage("gama_call") as counters:
+                audio_description = model_client.call(
+                    describe_audio_with_gama, audio_clip_path
+                )
+                counters["audio_bytes"] += len(audio_clip)
+                counters["retries"] += model_client.last_retries
+            return audio_description
+
+        response_cache = get_response_cache()
+        if response_cache is None:
+            audio_description = describe_audio()
+        else:
+            key = response_cache.make_key(GAMA_MODEL, SOUND_QUESTION, audio_clip)
+            audio_description = response_cache.get_or_call(
+                key, describe_audio, on_hit=record_cache_hit("gama_cache_hit")
+            )
+        # save audio_description to a txt file
+        # with open(os.path.join(self.audio_output_dir, "audio_description.txt"), "a") as f:
+        #     f.write(
+        #         f"Time {audio_clip_start_seconds:.1f}-{audio_clip_end_seconds:.1f}s: {audio_description}\n"
+        #     )
+        return audio_description
+
+    ######## Driver ########
+    # Parse the video end to end and write {VIDEO_ID}_video_knowledge.json;
+    # returns a short summary of the run
+    def run(self):
+        print("--> Initializing...")
+        metrics = RunMetrics(self.video_id)
+        run_metrics.set_current(metrics)
+        report_path = os.path.join(self.res_output_dir, f"{self.video_id}_run_report.json")
+        # read before a fresh run cleans the results directory
+        previous_report = run_metrics.load_report(report_path)
+        try:
+            summary = self._run(metrics)
+            metrics.extra["status"] = "done"
+            return summary
+        except BaseException as e:
+            metrics.extra["status"] = "failed"
+            metrics.extra["error"] = repr(e)
+            raise
+        finally:
+            # cumulative over the videos parsed in this process
+            metrics.extra["model_clients"] = {
+                service: model_client.stats()
+                for service, model_client in sorted(_model_clients.items())
+            }
+            # per-stage timings and counters, compared with the previous run of this
+            # video; a failed run is reported too, with the retries that led to it
+            os.makedirs(self.res_output_dir, exist_ok=True)
+            metrics.save(
+                report_path,
+                os.path.join(self.res_output_dir, f"{self.video_id}_run_report.prom"),
+                previous=previous_report,
+            )
+            run_metrics.set_current(None)
+
+    def _run(self, metrics):
+        self.load_annotations()
+        self.prepare_directories()
+
+        # per-request details (e.g. bytes uploaded) go to a log file, not to the progress bar
+        log_handler = logging.FileHandler(
+            os.path.join(self.res_output_dir, f"{self.video_id}_requests.log")
+        )
+        log_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(log_handler)
+        logger.setLevel(logging.INFO)
+        try:
+            self._parse_sentences()
+        finally:
+            logger.removeHandler(log_handler)
+            log_handler.close()
+
+        # Assemble the final output from the checkpoint, in sentenceIndex order
+        finished, _ = load_checkpoint(self.checkpoint_path, self.sentence_fingerprints)
+        video_knowledge_output = [
+            finished[sentenceInfo["sentenceIndex"]]
+            for sentenceInfo in self.transcript_sentence
+            if sentenceInfo["sentenceIndex"] in finished
+        ]
+        with open(self.output_path, "w") as f:
+            json.dump(video_knowledge_output, f, indent=4)
+        # the same pieces as JSON Lines with a time index, for range queries
+        write_knowledge(video_knowledge_output, self.indexed_output_path)
+        # BM25 index over the segments, served by knowledge_search.py
+        from knowledge_search import KnowledgeSearchIndex, index_path_for
+
+        KnowledgeSearchIndex.build(video_knowledge_output).save(
+            index_path_for(self.indexed_output_path)
+        )
 
-        last_end_time = endTime
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            stats = response_cache.stats()
+            metrics.extra["response_cache"] = stats
+            print(
+                f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate, {stats['size_bytes'] / 1024:.0f} KB on disk)"
+            )
+
+        if self.sound_windows.num_sentences:
+            metrics.extra["sound_windows"] = self.sound_windows.report()
+            report = self.sound_windows.report()
+            print(
+                f"Sound windows: {report['sentences']} sentences -> {report['windows']} windows "
+                f"({report['calls_saved']} model calls saved)."
+            )
+        if self.audio_screen is not None:
+            self.save_audio_screen()
+
+        return {
+            "video_id": self.video_id,
+            "scenes": len(self.key_frame_index) if self.key_frame_index else 0,
+            "sentences": len(self.transcript_sentence),
+            "parsed": len(video_knowledge_output),
+            "sound_calls_saved": self.sound_windows.report()["calls_saved"],
+            "output": self.output_path,
+        }
+
+    # Write the pre-screen thresholds and the features of every window screened in
+    # this run to {VIDEO_ID}_audio_screen.json, for tuning the thresholds
+    def save_audio_screen(self):
+        windows = sorted(self.audio_screen_results, key=lambda window: window["segment"])
+        sent = sum(1 for window in windows if window["label"] == "environmental")
+        print(f"Audio pre-screen: {sent} of {len(windows)} windows sent to GAMA.")
+        with open(
+            os.path.join(self.res_output_dir, f"{self.video_id}_audio_screen.json"), "w"
+        ) as f:
+            json.dump(
+                {"thresholds": self.audio_screen.thresholds, "windows": windows}, f, indent=4
+            )
+
+    # Parse all sentences with at most `max_workers` model calls in flight.
+    # Each sentence's segment starts where the previous sentence ended, so the start
+    # times are fixed up front. Every finished piece is appended to the checkpoint
+    # right away, so a crashed or rate-limited run picks up where it stopped; the
+    # final output is assembled from the checkpoint in sentenceIndex order.
+    def _parse_sentences(self):
+        from tqdm import tqdm
+
+        sentences = self.transcript_sentence
+        # sample a few sentences for testing
+        # sentences = sentences[:3]
+        segment_start_times = [0] + [s["endTime"] for s in sentences[:-1]]
+        procedure_descriptions = self.locate_procedure_annotations(sentences)
+        fingerprints = [
+            sentence_fingerprint(sentenceInfo, segment_start_times[i], procedure_descriptions[i])
+            for i, sentenceInfo in enumerate(sentences)
+        ]
+        self.sentence_fingerprints = {
+            sentenceInfo["sentenceIndex"]: fingerprints[i]
+            for i, sentenceInfo in enumerate(sentences)
+        }
+
+        finished, stale = load_checkpoint(self.checkpoint_path, self.sentence_fingerprints)
+        if finished:
+            print(f"Resuming: {len(finished)} sentences already parsed.")
+        if stale:
+            print(f"Ignoring {stale} checkpointed sentences that no longer match the transcript.")
+        pending = [
+            i
+            for i, sentenceInfo in enumerate(sentences)
+            if sentenceInfo["sentenceIndex"] not in finished
+        ]
+        if not pending:
+            # nothing to parse: skip scene detection and audio decoding altogether
+            return
+        needs_vision = any(
+            key in REQUIRED_KEY
+            for key in ("step_description", "food_and_kitchenware_description")
+        )
+        needs_sound = (
+            self.describe_sound_enabled
+            and "environment_sound_description" in REQUIRED_KEY
+        )
+        parts = {i: {} for i in pending}
+        expected_parts = int(needs_vision) + int(needs_sound)
+
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint_file, tqdm(
+            total=len(sentences),
+            initial=len(sentences) - len(pending),
+            desc="Parsing video",
+            unit="sentence",
+        ) as progress:
+            # terminate a line left half-written by a crash so the next record starts clean
+            if checkpoint_file.tell() > 0:
+                with open(self.checkpoint_path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        checkpoint_file.write("\n")
+
+            def finish(i):
+                _info_piece = self.assemble(
+                    sentences[i],
+                    segment_start_times[i],
+                    procedure_descriptions[i],
+                    parts[i].get("vision", {}),
+                    parts[i].get("sound", {}),
+                )
+                record = {"sentence": fingerprints[i], "piece": _info_piece}
+                checkpoint_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint_file.flush()
+                progress.update(1)
+
+            if expected_parts == 0:
+                for i in pending:
+                    finish(i)
+                return
+
+            metrics = run_metrics.current()
+
+            # run a stage of sentence i with its metrics attributed to the sentence
+            # (a shared sound window to its first sentence)
+            def measured(i, describe, *args):
+                with metrics.for_sentence(sentences[i]["sentenceIndex"]):
+                    return describe(*args)
+
+            with ThreadPoolExecutor(max_workers=2) as stage_pool, ThreadPoolExecutor(
+                max_workers=max(1, self.max_workers)
+            ) as call_pool:
+                # scene detection and audio extraction are independent, run them together
+                stages = {stage_pool.submit(self.extract_audio): "sound"}
+                if needs_vision:
+                    stages[
+                        stage_pool.submit(self.detect_scenes, [sentences[i] for i in pending])
+                    ] = "vision"
+                calls = {}
+                try:
+                    # queue the model calls of each stage as soon as its input is ready
+                    for stage in as_completed(stages):
+                        part = stages[stage]
+                        if part == "sound" and not needs_sound:
+                            # the audio track is only a by-product here, don't fail the run
+                            if stage.exception() is not None:
+                                logger.warning("audio extraction failed: %r", stage.exception())
+                            continue
+                        stage.result()
+                        if part == "vision":
+                            # one request for a run of short sentences (VISION_REQUEST_MODE)
+                            batches = self.plan_vision_requests([sentences[i] for i in pending])
+                            for batch in batches:
+                                targets = [pending[position] for position in batch]
+                                calls[
+                                    call_pool.submit(
+                                        measured,
+                                        targets[0],
+                                        self.describe_vision_batch,
+                                        [sentences[i] for i in targets],
+                                    )
+                                ] = (targets, part)
+                        else:
+                            # one call per distinct sound window, shared by its sentences
+                            windows = self.sound_windows.schedule([sentences[i] for i in pending])
+                            for window, positions in windows.items():
+                                targets = [pending[position] for position in positions]
+                                calls[
+                                    call_pool.submit(
+                                        measured, targets[0], self.describe_sound_window, *window
+                                    )
+                                ] = (targets, part)
+                    for call in as_completed(calls):
+                        targets, part = calls[call]
+                        result = call.result()
+                        for position, i in enumerate(targets):
+                            # a vision batch answers per sentence, a sound window is shared
+                            parts[i][part] = result[position] if part == "vision" else result
+                            if len(parts[i]) == expected_parts:
+                                finish(i)
+                except BaseException:
+                    for future in list(stages) + list(calls):
+                        future.cancel()
+                    raise
+
+
+#####################################
+######## Main function ##############
+#####################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video_id", type=str, default=DEFAULT_VIDEO_ID)
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=1,
+        help="number of model calls in flight (1 = sequential)",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="discard the checkpoint and audio clips of a previous run and start over",
+    )
+    parser.add_argument(
+        "--sound",
+        action="store_true",
+        help="describe the environment sound of every sentence with GAMA",
+    )
+    args = parser.parse_args()
 
-    with open(
-        os.path.join(res_output_dir, f"{VIDEO_ID}_video_knowledge.json"), "w"
-    ) as f:
-        json.dump(video_knowledge_output, f, indent=4)
+    VideoPipeline(
+        args.video_id,
+        max_workers=args.max_workers,
+        fresh=args.fresh,
+        describe_sound=args.sound,
+    ).run()
@@ -0,0 +1,134 @@
+"""
+Vision Request Planning
+
+Fuses the GPT vision requests of the parser. Instead of one request per field
+(step description, food and kitchenware description) per sentence, each
+sending the same frames, one request asks for all fields of a sentence in a
+structured response (a JSON schema with one string per field). Runs of
+consecutive short sentences, which mostly share their frames, can be packed
+into one request with a per-segment answer for each of them; every distinct
+frame is then uploaded once for the whole run.
+
+plan_batches() packs consecutive segments while they stay within the budget
+(number of segments, distinct frames); a segment longer than `max_segment_ms`
+always gets a request of its own. The prompt numbers the images and tells which
+images belong to which segment. parse_fused_response() raises ValueError for a
+response that does not follow the schema, so the caller can fall back to
+separate requests.
+
+Usage:
+    batches = plan_batches(segments, max_segments=4, max_images=12, max_segment_ms=8000)
+    # segments: [(start_ms, end_ms, frame keys)] in time order -> [[positions], ...]
+    images, image_numbers = number_images(segment_images)
+    prompt = fused_prompt(field_prompts, image_numbers)
+    schema = response_schema(list(field_prompts), len(segment_images))
+    answers = parse_fused_response(content, list(field_prompts), len(segment_images))
+    # -> [{"step_description": ..., "food_and_kitchenware_description": ...}, ...]
+"""
+
+import json
+
+
+# Pack consecutive segments into batches of at most `max_segments`, whose frames
+# together are at most `max_images` distinct ones; returns lists of positions
+def plan_batches(segments, max_segments=4, max_images=12, max_segment_ms=8000):
+    batches = []
+    current = []
+    current_frames = set()
+    for position, (start, end, frames) in enumerate(segments):
+        frames = set(frames)
+        short = end - start <= max_segment_ms
+        if (
+            current
+            and short
+            and len(current) < max_segments
+            and len(current_frames | frames) <= max_images
+        ):
+            current.append(position)
+            current_frames |= frames
+            continue
+        if current:
+            batches.append(current)
+        current = [position]
+        current_frames = frames
+        if not short:
+            # a long segment is never packed with the following ones either
+            batches.append(current)
+            current = []
+            current_frames = set()
+    if current:
+        batches.append(current)
+    return batches
+
+
+# The distinct images of the segments in order of first use, and for every segment
+# the (1-based) numbers of its images
+def number_images(segment_images):
+    numbers = {}
+    images = []
+    image_numbers = []
+    for segment in segment_images:
+        segment_numbers = []
+        for image in segment:
+            if image not in numbers:
+                images.append(image)
+                numbers[image] = len(images)
+            segment_numbers.append(numbers[image])
+        image_numbers.append(segment_numbers)
+    return images, image_numbers
+
+
+def _segment_key(k):
+    return f"segment_{k}"
+
+
+def fused_prompt(field_prompts, image_numbers):
+    count = len(image_numbers)
+    lines = [
+        "These numbered screenshots come from a cooking video"
+        + (f" and cover {count} consecutive segments of it." if count > 1 else ".")
+    ]
+    for k, numbers in enumerate(image_numbers, 1):
+        images = ", ".join(map(str, numbers)) if numbers else "none"
+        lines.append(f"Segment {k}: images {images}.")
+    lines.append(
+        "For every segment, answer each field below considering only that segment's images:"
+    )
+    for field, prompt in field_prompts.items():
+        lines.append(f"- {field}: {' '.join(prompt.split())}")
+    lines.append(f"Answer in JSON with one object per segment ({_segment_key(1)}, ...).")
+    return "\n".join(lines)
+
+
+# JSON schema (strict structured output) of the answer for `count` segments
+def response_schema(fields, count):
+    segment = {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+    keys = [_segment_key(k) for k in range(1, count + 1)]
+    return {
+        "type": "object",
+        "properties": {key: segment for key in keys},
+        "required": keys,
+        "additionalProperties": False,
+    }
+
+
+# the answers of a fused response, one dict of fields per segment
+def parse_fused_response(content, fields, count):
+    try:
+        data = json.loads(content)
+        answers = [
+            {field: data[_segment_key(k)][field] for field in fields}
+            for k in range(1, count + 1)
+        ]
+    except (TypeError, KeyError, ValueError) as error:
+        raise ValueError(f"unusable fused response: {error!r}") from error
+    for answer in answers:
+        for field, value in answer.items():
+            if not isinstance(value, str):
+                raise ValueError(f"unusable fused response: {field} is not a string")
+    return answers